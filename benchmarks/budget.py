@@ -0,0 +1,181 @@
+# benchmarks/budget.py
+"""
+Query-count and latency budget tests for URL confs.
+
+Subclass EndpointBudgetTestCase, point it at a URL conf and describe how
+to call each URL on a Fixture. One test is generated per endpoint: it
+runs the request against fixtures of growing size and fails if the query
+count grows with the data. A request slower than its latency budget is
+only logged, since wall-clock time depends on the machine; set
+ENFORCE_LATENCY_BUDGETS=1 in the environment to fail on it too, e.g. on
+a dedicated benchmark runner. Another test fails if a URL in the conf
+has no endpoint described.
+"""
+from dataclasses import dataclass, field
+from importlib import import_module
+import logging
+import os
+import time
+import unittest
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from blindspark.sqlshapes import shape_counts
+from chat.models import ChatRoom, Message, RevealRequest
+from match.models import DiscoveryLog, Like, Match
+from match.utils import pair_score_cache
+from users.models import User
+from .population import generate_population
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_MS = 300
+
+
+def latency_enforced():
+    return os.environ.get('ENFORCE_LATENCY_BUDGETS', '') not in ('', '0')
+
+
+@dataclass
+class Fixture:
+    size: int
+    viewer: User
+    # Adult user with no likes or match either way with the viewer
+    stranger: User
+    matches: list
+    chatroom: ChatRoom
+    own_message: Message
+
+
+def build_fixture(size, seed=0):
+    """
+    A population of ``size`` users plus a viewer whose chats grow with it:
+    ``size // 10`` matches, each with ``size // 10`` messages.
+    """
+    population = generate_population(size, seed=seed, prefix='budget')
+    viewer = User.objects.get(id=population.user_ids[0])
+    others = population.user_ids[1:]
+
+    per_user = max(size // 10, 1)
+    matches = []
+    for other_id in others[:per_user]:
+        a, b = sorted([viewer.id, other_id])
+        match = Match.objects.create(user_a_id=a, user_b_id=b, compatibility_score=50)
+        room = ChatRoom.objects.create(match=match)
+        Message.objects.bulk_create(
+            Message(chat=room, sender_id=viewer.id if i % 2 else other_id, text=f"Message {i}")
+            for i in range(per_user)
+        )
+        matches.append(match)
+
+    stranger = User.objects.get(id=others[-1])
+    Like.objects.filter(from_user=viewer, to_user=stranger).delete()
+    Like.objects.filter(from_user=stranger, to_user=viewer).delete()
+    DiscoveryLog.objects.filter(viewer=viewer, viewed_user=stranger).delete()
+
+    chatroom = matches[0].chatroom
+    own_message = Message.objects.create(chat=chatroom, sender=viewer, text="Mine")
+    RevealRequest.objects.create(match=matches[0], requester_id=others[0])
+
+    return Fixture(
+        size=size, viewer=viewer, stranger=stranger,
+        matches=matches, chatroom=chatroom, own_message=own_message,
+    )
+
+
+@dataclass
+class Endpoint:
+    """How to call one named URL on a Fixture."""
+    args: object = None  # callable(fixture) -> URL args
+    method: str = 'get'
+    data: object = None  # callable(fixture) -> request data
+    ajax: bool = False
+    anonymous: bool = False
+    budget_ms: float = DEFAULT_BUDGET_MS
+    # Known to scale with data; the test is expected to fail until fixed
+    known_regression: bool = False
+    headers: dict = field(default_factory=dict)
+
+
+class EndpointBudgetTestCase(TestCase):
+    urlconf = None  # dotted path, e.g. 'match.urls'
+    endpoints = {}  # URL name -> Endpoint
+    sizes = (10, 30, 90)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, endpoint in cls.endpoints.items():
+            test = cls._make_test(name, endpoint)
+            if endpoint.known_regression:
+                test = unittest.expectedFailure(test)
+            setattr(cls, f'test_{name}_budget', test)
+
+    @staticmethod
+    def _make_test(name, endpoint):
+        def test(self):
+            self.check_endpoint(name, endpoint)
+        test.__name__ = f'test_{name}_budget'
+        test.__doc__ = f"{name}: constant query count (and under {endpoint.budget_ms:g} ms if enforced)"
+        return test
+
+    def test_every_url_has_an_endpoint(self):
+        if self.urlconf is None:
+            return
+        module = import_module(self.urlconf)
+        names = {pattern.name for pattern in module.urlpatterns}
+        missing = names - set(self.endpoints)
+        self.assertFalse(missing, f"No budget endpoint for {sorted(missing)} in {self.urlconf}")
+
+    def request(self, name, endpoint, fixture):
+        namespace = import_module(self.urlconf).app_name
+        args = endpoint.args(fixture) if endpoint.args else []
+        url = reverse(f'{namespace}:{name}', args=args)
+        data = endpoint.data(fixture) if endpoint.data else None
+
+        client = Client()
+        if not endpoint.anonymous:
+            client.force_login(fixture.viewer)
+        headers = dict(endpoint.headers)
+        if endpoint.ajax:
+            headers['HTTP_X_REQUESTED_WITH'] = 'XMLHttpRequest'
+
+        cache.clear()
+        pair_score_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, endpoint.method)(url, data, **headers)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        return response, [q['sql'] for q in queries.captured_queries], elapsed_ms
+
+    def check_endpoint(self, name, endpoint):
+        runs = []
+        for size in self.sizes:
+            with transaction.atomic():
+                fixture = build_fixture(size)
+                response, statements, elapsed_ms = self.request(name, endpoint, fixture)
+                transaction.set_rollback(True)
+            self.assertLess(response.status_code, 400, f"{name} returned {response.status_code} at size {size}")
+            runs.append((size, statements, elapsed_ms))
+
+        (small, small_sql, _), (large, large_sql, _) = runs[0], runs[-1]
+        if len(large_sql) > len(small_sql):
+            before, after = shape_counts(small_sql), shape_counts(large_sql)
+            grown = [
+                f"  {before[shape]:>4} -> {count:<4} {shape}"
+                for shape, count in after.most_common() if count > before[shape]
+            ]
+            self.fail(
+                f"{name}: {len(small_sql)} queries at size {small}, {len(large_sql)} at size {large}.\n"
+                "Statements that grew with the data:\n" + "\n".join(grown)
+            )
+
+        slowest = max(elapsed for _, _, elapsed in runs)
+        if slowest > endpoint.budget_ms:
+            message = f"{name}: {slowest:.1f} ms exceeds its {endpoint.budget_ms:g} ms budget"
+            if latency_enforced():
+                self.fail(message)
+            logger.warning(message)
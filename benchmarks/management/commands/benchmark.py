@@ -0,0 +1,79 @@
+from datetime import datetime, timezone
+import json
+import platform
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks.population import generate_population
+from benchmarks.suites import SUITES
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark endpoints against seeded synthetic populations in a throwaway "
+        "test database, and write wall time, query count and peak memory as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000],
+            help="Population sizes to generate, e.g. 1000 10000 100000 1000000.",
+        )
+        parser.add_argument('--suite', choices=sorted(SUITES), action='append', help="Default: all suites.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='bench_output.json')
+
+    def handle(self, *args, **options):
+        suites = options['suite'] or sorted(SUITES)
+        report = {
+            'commit': _git_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'results': [],
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for size in options['sizes']:
+                call_command('flush', interactive=False, verbosity=0)
+                self.stdout.write(f"Generating {size:,} users...")
+                population = generate_population(size, seed=options['seed'])
+                for suite in suites:
+                    for result in SUITES[suite](population, options['repeat']):
+                        result.update(suite=suite, size=size)
+                        report['results'].append(result)
+                        self.stdout.write(
+                            f"  {suite:<10} {result['endpoint']:<30} "
+                            f"{result['wall_ms']['median']:>10.1f} ms "
+                            f"{result['queries']:>5} queries "
+                            f"{result['peak_kb']:>10.1f} KiB"
+                        )
+        except RuntimeError as exc:
+            raise CommandError(str(exc)) from exc
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(report['results'])} results to {options['output']}"))
@@ -0,0 +1,123 @@
+# benchmarks/population.py
+"""
+Seeded synthetic populations for benchmarks and query-budget tests.
+
+Rows are written with bulk_create, which skips model signals, so the
+derived User columns (geo_cell, interest_mask, profile_completion) are
+filled in here and the caches that signals would invalidate are reset.
+"""
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from functools import lru_cache
+import random
+
+from django.contrib.auth.hashers import make_password
+
+from match.models import DiscoveryLog, Like
+from users.backends import invalidate_user
+from users.catalog import bump_catalog_version
+from users.models import Interest, User
+from users.utils import geo_cell, interest_mask
+
+INTEREST_NAMES = [
+    'Art', 'Baking', 'Board Games', 'Books', 'Camping', 'Chess', 'Coffee', 'Cooking',
+    'Cricket', 'Cycling', 'Dancing', 'Fashion', 'Fitness', 'Football', 'Gaming', 'Gardening',
+    'Hiking', 'History', 'Movies', 'Music', 'Painting', 'Pets', 'Photography', 'Poetry',
+    'Running', 'Science', 'Singing', 'Startups', 'Swimming', 'Tech', 'Theatre', 'Travel',
+    'Volunteering', 'Writing', 'Yoga',
+]
+
+# (lat, lon) of the cities users cluster around
+CITIES = {
+    'Thrissur': (10.5276, 76.2144),
+    'Kochi': (9.9312, 76.2673),
+    'Bengaluru': (12.9716, 77.5946),
+    'Chennai': (13.0827, 80.2707),
+    'Mumbai': (19.0760, 72.8777),
+    'Delhi': (28.7041, 77.1025),
+}
+
+PASSWORD = 'bench-password'
+BATCH_SIZE = 5000
+
+
+@dataclass
+class Population:
+    size: int
+    seed: int
+    user_ids: list = field(default_factory=list)
+    interest_ids: list = field(default_factory=list)
+
+
+@lru_cache(maxsize=None)
+def _password_hash():
+    # Hashing is deliberately slow; every synthetic user shares one hash
+    return make_password(PASSWORD)
+
+
+def _bulk(model, objs):
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+
+
+def generate_population(size, seed=0, likes_per_user=3, views_per_user=5, prefix='bench'):
+    """
+    Create ``size`` users with interests, locations, likes and discovery logs.
+
+    The same ``seed`` always produces the same rows, so runs on different
+    commits measure identical data.
+    """
+    rng = random.Random(seed)
+
+    Interest.objects.bulk_create(
+        [Interest(name=name) for name in INTEREST_NAMES], ignore_conflicts=True
+    )
+    bump_catalog_version()
+    interest_ids = sorted(Interest.objects.filter(name__in=INTEREST_NAMES).values_list('id', flat=True))
+
+    password = _password_hash()
+    cities = list(CITIES.items())
+    today = date.today()
+    start = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    user_ids = list(range(start, start + size))
+
+    links = []
+    for offset in range(0, size, BATCH_SIZE):
+        users = []
+        for user_id in user_ids[offset:offset + BATCH_SIZE]:
+            city, (lat, lon) = rng.choice(cities)
+            lat, lon = lat + rng.gauss(0, 0.15), lon + rng.gauss(0, 0.15)
+            picked = rng.sample(interest_ids, rng.randint(1, 6))
+            links.extend((user_id, interest_id) for interest_id in picked)
+            user = User(
+                id=user_id,
+                username=f'{prefix}{seed}_{user_id}',
+                email=f'{prefix}{seed}_{user_id}@example.com',
+                password=password,
+                gender=rng.choice('MF'),
+                dob=today - timedelta(days=rng.randint(18 * 366, 45 * 365)),
+                bio="Synthetic benchmark user.",
+                city=city,
+                latitude=lat,
+                longitude=lon,
+                geo_cell=geo_cell(lat, lon),
+                interest_mask=interest_mask(picked),
+            )
+            user.profile_completion = user.compute_profile_completion()
+            users.append(user)
+        _bulk(User, users)
+        # Rolled-back tests reuse ids; drop any cached request.user rows for them
+        invalidate_user(*(user.id for user in users))
+
+    Through = User.interests.through
+    _bulk(Through, [Through(user_id=u, interest_id=i) for u, i in links])
+
+    likes, views = set(), set()
+    for user_id in user_ids:
+        for _ in range(likes_per_user):
+            likes.add((user_id, rng.choice(user_ids)))
+        for _ in range(views_per_user):
+            views.add((user_id, rng.choice(user_ids)))
+    _bulk(Like, [Like(from_user_id=a, to_user_id=b) for a, b in sorted(likes) if a != b])
+    _bulk(DiscoveryLog, [DiscoveryLog(viewer_id=a, viewed_user_id=b) for a, b in sorted(views) if a != b])
+
+    return Population(size=size, seed=seed, user_ids=user_ids, interest_ids=interest_ids)
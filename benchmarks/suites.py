@@ -0,0 +1,232 @@
+# benchmarks/suites.py
+"""
+Benchmark suites run by ``manage.py benchmark``.
+
+A suite takes a generated Population and a repeat count and returns one
+result dict per measured endpoint. Register new suites in SUITES.
+"""
+from datetime import timedelta
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from chat.models import ChatRoom, Message
+from chat.search import like_search, search_messages
+from chat.utils import message_days
+from match.feed import invalidate_feed
+from match.models import Match
+from users.models import User
+
+CONVERSATION_LENGTH = 5000
+
+
+def measure(name, call, repeat, setup=None):
+    """
+    Time ``call`` ``repeat`` times, then run it once more under tracemalloc.
+
+    ``setup`` runs before every call, outside the measurement. The query
+    count is taken from the last timed call.
+    """
+    timings, query_count = [], 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - started) * 1000)
+        query_count = len(queries)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'endpoint': name,
+        'wall_ms': {
+            'median': round(statistics.median(timings), 3),
+            'min': round(min(timings), 3),
+            'max': round(max(timings), 3),
+        },
+        'queries': query_count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request['PATH_INFO']} returned {response.status_code}")
+    return response
+
+
+def discovery_suite(population, repeat):
+    rng = random.Random(population.seed)
+    viewer = User.objects.get(id=population.user_ids[0])
+    client = Client()
+    client.force_login(viewer)
+    ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+    discover_url = reverse('matches:discover')
+
+    results = [
+        measure(
+            'discover (cold feed)',
+            lambda: _check(client.get(discover_url)),
+            repeat,
+            setup=lambda: invalidate_feed(viewer),
+        ),
+        measure('discover (warm feed)', lambda: _check(client.get(discover_url)), repeat),
+    ]
+
+    cursor = client.get(discover_url, {'page': 1}, **ajax).json()['cursor']
+    results.append(measure(
+        'discover (next cursor page)',
+        lambda: _check(client.get(discover_url, {'cursor': cursor}, **ajax)) if cursor else None,
+        repeat,
+    ))
+
+    # Each view and like gets a fresh target so no call is a no-op
+    targets = iter(rng.sample(population.user_ids[1:], min(len(population.user_ids) - 1, 2 * repeat + 2)))
+    results.append(measure(
+        'view_profile',
+        lambda: _check(client.get(reverse('matches:view_profile', args=[next(targets)]))),
+        repeat,
+    ))
+    results.append(measure(
+        'like_user',
+        lambda: _check(client.post(reverse('matches:like_user', args=[next(targets)]), **ajax)),
+        repeat,
+    ))
+    return results
+
+
+def _conversation(population, length, text=lambda i: f"Message {i}"):
+    """A chat between the first two users with ``length`` messages, about 20 a day."""
+    a, b = sorted(population.user_ids[:2])
+    match, _ = Match.objects.get_or_create(user_a_id=a, user_b_id=b, defaults={'compatibility_score': 50})
+    room, _ = ChatRoom.objects.get_or_create(match=match)
+    Message.objects.bulk_create(
+        (Message(chat=room, sender_id=(a, b)[i % 2], text=text(i)) for i in range(length)),
+        batch_size=1000,
+    )
+    messages = list(room.messages.order_by('id'))
+    start = timezone.now() - timedelta(hours=len(messages) * 1.2)
+    for i, message in enumerate(messages):
+        message.timestamp = start + timedelta(hours=i * 1.2)
+    Message.objects.bulk_update(messages, ['timestamp'], batch_size=1000)
+    return room, User.objects.get(id=a), messages
+
+
+def chat_suite(population, repeat):
+    room, viewer, messages = _conversation(population, CONVERSATION_LENGTH)
+    today = timezone.localdate()
+    context = {
+        'user': viewer,
+        'today': today,
+        'yesterday': today - timedelta(days=1),
+        'fragment_ttl': settings.CHAT_FRAGMENT_CACHE_TTL,
+    }
+    label = f'{len(messages):,} messages'
+
+    def render():
+        return render_to_string('chat/_messages.html', {**context, 'days': message_days(messages)})
+
+    client = Client()
+    client.force_login(viewer)
+    fetch_url = reverse('chat:fetch_messages', args=[room.id])
+    middle = messages[len(messages) // 2].id
+
+    return [
+        measure(
+            f'render {label} (cold fragment cache)', render, repeat,
+            setup=caches['template_fragments'].clear,
+        ),
+        measure(f'render {label} (warm fragment cache)', render, repeat),
+        measure('fetch_messages (latest window)', lambda: _check(client.get(fetch_url)), repeat),
+        measure(
+            'fetch_messages (older page)',
+            lambda: _check(client.get(fetch_url, {'before_id': middle})),
+            repeat,
+        ),
+    ]
+
+
+# (label, SESSION_ENGINE, auth backend) for polling_suite
+AUTH_PATHS = [
+    ('db', 'django.contrib.sessions.backends.db', 'django.contrib.auth.backends.ModelBackend'),
+    ('cached', 'django.contrib.sessions.backends.cached_db', 'users.backends.CachedModelBackend'),
+]
+
+
+def polling_suite(population, repeat):
+    """The endpoints pages poll every few seconds, with and without the cached session and user."""
+    room, viewer, _ = _conversation(population, 50)
+    fetch_url = reverse('chat:fetch_messages', args=[room.id])
+    since = timezone.now()
+
+    results = []
+    for label, engine, backend in AUTH_PATHS:
+        with override_settings(SESSION_ENGINE=engine, AUTHENTICATION_BACKENDS=[backend]):
+            client = Client()
+            client.force_login(viewer, backend=backend)
+            latest = _check(client.get(fetch_url)).json()
+            delta = {'after_id': latest['last_id'], 'since': latest['version']}
+            polls = [
+                ('fetch_messages (idle delta)', lambda: _check(client.get(fetch_url, delta))),
+                ('chat_list_changes', lambda: _check(client.get(
+                    reverse('chat:chat_list_changes'), {'since': since.isoformat()},
+                ))),
+                ('unread_count_api', lambda: _check(client.get(reverse('chat:unread_count_api')))),
+                ('update_last_seen', lambda: _check(client.post(reverse('users:update_last_seen')))),
+            ]
+            for name, call in polls:
+                results.append(measure(f'{name} ({label} auth)', call, repeat))
+    return results
+
+
+# Word pool for searchable messages; the later words are rarer
+SEARCH_WORDS = (
+    "hey hi so what are you up to this weekend coffee movie tonight maybe "
+    "dinner hiking beach museum concert saxophone"
+).split()
+# Appears in one message in a thousand, so a LIKE scan can't stop early
+RARE_WORD = 'volcano'
+
+
+def search_suite(population, repeat):
+    rng = random.Random(population.seed)
+    weights = [1 / (rank + 1) for rank in range(len(SEARCH_WORDS))]
+    sentences = [' '.join(rng.choices(SEARCH_WORDS, weights, k=8)) for _ in range(CONVERSATION_LENGTH)]
+    for i in range(0, CONVERSATION_LENGTH, 1000):
+        sentences[i] += f' {RARE_WORD}'
+    room, viewer, _ = _conversation(population, CONVERSATION_LENGTH, text=sentences.__getitem__)
+
+    results = []
+    for word in ('coffee', RARE_WORD):
+        results.append(measure(f"search '{word}' (FTS5, ranked)", lambda: search_messages(viewer, word), repeat))
+        results.append(measure(
+            f"search '{word}' (LIKE scan)", lambda: like_search(word, [room.id], None, 21), repeat,
+        ))
+    return results
+
+
+SUITES = {
+    'chat': chat_suite,
+    'search': search_suite,
+    'discovery': discovery_suite,
+    'polling': polling_suite,
+}
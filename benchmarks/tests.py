@@ -0,0 +1,24 @@
+import os
+from unittest import mock
+
+from django.test import TestCase
+
+# Module import, so the runner doesn't collect EndpointBudgetTestCase itself
+from . import budget
+
+
+class LatencyBudgetTests(TestCase):
+    def check(self, environ):
+        case = budget.EndpointBudgetTestCase('test_every_url_has_an_endpoint')
+        case.urlconf, case.sizes = 'users.urls', (10,)
+        with mock.patch.dict(os.environ, environ):
+            case.check_endpoint('profile', budget.Endpoint(budget_ms=0))
+
+    def test_latency_is_reported_by_default(self):
+        with self.assertLogs('benchmarks.budget', 'WARNING') as logs:
+            self.check({'ENFORCE_LATENCY_BUDGETS': ''})
+        self.assertIn("profile: ", logs.output[0])
+
+    def test_latency_fails_when_enforced(self):
+        with self.assertRaisesMessage(AssertionError, "exceeds its 0 ms budget"):
+            self.check({'ENFORCE_LATENCY_BUDGETS': '1'})
@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blindspark.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after setup, since it loads models
+from chat.sockets import chat_socket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await chat_socket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
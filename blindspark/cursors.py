@@ -0,0 +1,17 @@
+# blindspark/cursors.py
+"""Opaque keyset cursors for ranked lists, e.g. the discovery feed and message search."""
+import base64
+
+
+def encode_cursor(score, row_id):
+    """Cursor for the row after which the next page starts, ordered by (-score, id)."""
+    return base64.urlsafe_b64encode(f"{score!r}:{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    """``(score, row_id)`` from an opaque cursor; ValueError if it is malformed."""
+    try:
+        score, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return float(score), int(row_id)
+    except (UnicodeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
@@ -0,0 +1,112 @@
+# blindspark/middleware.py
+from contextlib import ExitStack
+from datetime import datetime, timezone
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .sqlshapes import shape_counts
+
+logger = logging.getLogger('blindspark.queries')
+summary_logger = logging.getLogger('blindspark.queries.summary')
+
+QUERY_INSPECTOR_DEFAULTS = {
+    'ENABLED': False,
+    # Flag a statement shape run more than this many times in one request
+    'REPEAT_THRESHOLD': 5,
+    # Log statements slower than this
+    'SLOW_QUERY_MS': 100,
+    'LOG_FILE': None,
+    'LOG_MAX_BYTES': 10 * 1024 * 1024,
+    'LOG_BACKUP_COUNT': 5,
+    'RESPONSE_HEADERS': True,
+}
+
+
+class QueryInspectorMiddleware:
+    """
+    Opt-in N+1 and slow-query detector.
+
+    Records every SQL statement a request runs through
+    ``connection.execute_wrapper``, groups them by shape and flags shapes
+    repeated more than REPEAT_THRESHOLD times. Per-request summaries go to a
+    rotating JSONL file and X-Query-* response headers. Configure with the
+    QUERY_INSPECTOR setting; nothing is installed unless ENABLED is true.
+    """
+
+    def __init__(self, get_response):
+        self.config = {**QUERY_INSPECTOR_DEFAULTS, **getattr(settings, 'QUERY_INSPECTOR', {})}
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+        log_file = self.config['LOG_FILE']
+        if log_file and not summary_logger.handlers:
+            Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                log_file,
+                maxBytes=self.config['LOG_MAX_BYTES'],
+                backupCount=self.config['LOG_BACKUP_COUNT'],
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            summary_logger.addHandler(handler)
+            summary_logger.setLevel(logging.INFO)
+            summary_logger.propagate = False
+
+    def __call__(self, request):
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                statements.append((sql, (time.perf_counter() - started) * 1000))
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+            response = self.get_response(request)
+
+        summary = self.summarize(request, response, statements)
+        if summary_logger.handlers:
+            summary_logger.info(json.dumps(summary))
+        if self.config['RESPONSE_HEADERS']:
+            response['X-Query-Count'] = str(summary['queries'])
+            response['X-Query-Time-Ms'] = f"{summary['db_ms']:.1f}"
+            response['X-Query-Repeated'] = str(len(summary['repeated']))
+            response['X-Query-Slow'] = str(len(summary['slow']))
+        return response
+
+    def summarize(self, request, response, statements):
+        threshold = self.config['REPEAT_THRESHOLD']
+        slow_ms = self.config['SLOW_QUERY_MS']
+
+        repeated = [
+            {'shape': shape, 'count': count}
+            for shape, count in shape_counts(sql for sql, _ in statements).most_common()
+            if count > threshold
+        ]
+        slow = [{'sql': sql, 'ms': round(ms, 2)} for sql, ms in statements if ms > slow_ms]
+
+        for item in repeated:
+            logger.warning("%s %s: %d× %s", request.method, request.path, item['count'], item['shape'])
+        for item in slow:
+            logger.warning("%s %s: slow query (%.1f ms) %s", request.method, request.path, item['ms'], item['sql'])
+
+        return {
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': len(statements),
+            'db_ms': round(sum(ms for _, ms in statements), 2),
+            'repeated': repeated,
+            'slow': slow,
+        }
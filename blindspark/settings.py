@@ -43,6 +43,7 @@ INSTALLED_APPS = [
     'chat',
     'games',
     'adminpanel',
+    'benchmarks',
 
     'crispy_forms',
     'crispy_bootstrap5',
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'blindspark.middleware.QueryInspectorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -145,3 +147,85 @@ LOGOUT_REDIRECT_URL = 'home'
 
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
+
+# Seconds a materialized discovery feed is served before it is rebuilt
+DISCOVERY_FEED_TTL = 15 * 60
+
+# In-process cache of pairwise compatibility scores (see match.utils.PairScoreCache)
+PAIR_SCORE_CACHE_SIZE = 10000
+PAIR_SCORE_CACHE_TTL = 10 * 60
+
+# Seconds precomputed TopMatch rows (manage.py precompute_top_matches) stay usable for discovery
+TOP_MATCHES_MAX_AGE = 24 * 60 * 60
+
+# Opt-in SQL statement recorder (see blindspark.middleware.QueryInspectorMiddleware)
+QUERY_INSPECTOR = {
+    'ENABLED': False,
+    'REPEAT_THRESHOLD': 5,
+    'SLOW_QUERY_MS': 100,
+    'LOG_FILE': BASE_DIR / 'logs' / 'queries.jsonl',
+}
+
+# Pushes chat events to WebSockets (see chat.broadcast); the in-memory hub only reaches sockets in the same process
+CHAT_BROADCAST = {
+    'BACKEND': 'chat.broadcast.InMemoryBroadcast',
+    'OPTIONS': {'queue_size': 100},
+}
+
+# Longest a chat long-poll request (chat:wait_messages) is parked, in seconds
+CHAT_LONG_POLL_TIMEOUT = 25
+
+# Seconds a user's cached unread total (chat.unread) lives; sends and reads invalidate it sooner
+UNREAD_CACHE_TTL = 5 * 60
+
+# Messages per page when opening a chat or scrolling back through its history
+CHAT_HISTORY_PAGE_SIZE = 50
+
+# Seconds rendered message bubbles and date separators stay in the template fragment cache
+CHAT_FRAGMENT_CACHE_TTL = 24 * 60 * 60
+
+# {% cache %} uses the template_fragments alias when it exists; it holds one entry per
+# message bubble, far more than LocMemCache's default 300
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # request.user rows, see users/backends.py
+    'users': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'users',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Segment files of archived chat messages (manage.py archive_messages)
+CHAT_ARCHIVE_ROOT = BASE_DIR / "archive"
+# Messages older than this many days are moved to the archive
+CHAT_ARCHIVE_AFTER_DAYS = 365
+
+# A user counts as online for this many seconds after a heartbeat (users/presence.py)
+PRESENCE_ONLINE_WINDOW = 120
+# Buffered heartbeats are written to User.last_seen at most this often, in seconds
+PRESENCE_FLUSH_INTERVAL = 60
+
+# Sessions are read from the cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# ModelBackend stays listed so sessions created before the cached backend keep working
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# Seconds a cached request.user row may live; each hit is still checked against
+# is_active, password and profile_version in the database (users/backends.py)
+USER_CACHE_TTL = 300
+
+# Seconds a process may serve its Interest catalog before reloading (users/catalog.py)
+INTEREST_CATALOG_TTL = 300
+
+# Threads that render profile photo variants after an upload; 0 renders inline on commit
+PHOTO_VARIANT_WORKERS = 2
@@ -0,0 +1,28 @@
+# blindspark/sqlshapes.py
+"""Normalize SQL statements into shapes, so repeated queries can be counted."""
+from collections import Counter
+import re
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+_SELECT_LIST = re.compile(r"^SELECT\s.*?\sFROM\s", re.IGNORECASE | re.DOTALL)
+
+
+def sql_shape(sql):
+    """
+    ``sql`` with literals replaced by ``?``, IN lists collapsed and the
+    outer SELECT column list elided, e.g. ``SELECT ... FROM t WHERE id IN (...)``.
+    """
+    shape = _SELECT_LIST.sub('SELECT ... FROM ', sql.strip())
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    shape = shape.replace('%s', '?')
+    shape = _IN_LIST.sub('IN (...)', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def shape_counts(statements):
+    """Counter of shapes for an iterable of SQL strings."""
+    return Counter(sql_shape(sql) for sql in statements)
@@ -0,0 +1,60 @@
+import json
+from pathlib import Path
+import tempfile
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from users.models import User
+from .middleware import QueryInspectorMiddleware, summary_logger
+from .sqlshapes import shape_counts, sql_shape
+
+
+class SqlShapeTests(SimpleTestCase):
+    def test_literals_and_in_lists_collapse(self):
+        self.assertEqual(
+            sql_shape("SELECT a, b FROM t WHERE id = 12 AND name = 'it''s'  AND x IN (%s, %s, %s)"),
+            "SELECT ... FROM t WHERE id = ? AND name = ? AND x IN (...)",
+        )
+        counts = shape_counts(["SELECT * FROM t WHERE id = 1", "SELECT * FROM t WHERE id = 2"])
+        self.assertEqual(counts, {"SELECT ... FROM t WHERE id = ?": 2})
+
+
+class QueryInspectorTests(TestCase):
+    def setUp(self):
+        logs = tempfile.TemporaryDirectory()
+        self.addCleanup(logs.cleanup)
+        self.log_file = Path(logs.name) / 'queries.jsonl'
+        self.addCleanup(self.remove_handlers)
+
+    def remove_handlers(self):
+        for handler in summary_logger.handlers[:]:
+            summary_logger.removeHandler(handler)
+            handler.close()
+
+    def inspect(self, lookups):
+        def view(request):
+            for user_id in range(lookups):
+                User.objects.filter(id=user_id).exists()
+            return HttpResponse()
+
+        config = {'ENABLED': True, 'REPEAT_THRESHOLD': 5, 'LOG_FILE': self.log_file}
+        with override_settings(QUERY_INSPECTOR=config):
+            middleware = QueryInspectorMiddleware(view)
+        return middleware(RequestFactory().get('/discover/'))
+
+    def test_repeated_shapes_are_reported(self):
+        with self.assertLogs('blindspark.queries', 'WARNING') as logs:
+            response = self.inspect(6)
+        self.assertIn('GET /discover/: 6×', logs.output[0])
+        self.assertEqual(response['X-Query-Count'], '6')
+        self.assertEqual(response['X-Query-Repeated'], '1')
+
+        summary = json.loads(self.log_file.read_text().splitlines()[-1])
+        self.assertEqual((summary['path'], summary['status'], summary['queries']), ('/discover/', 200, 6))
+        self.assertEqual(summary['repeated'][0]['count'], 6)
+        self.assertIn('"users_user"', summary['repeated'][0]['shape'])
+
+    def test_under_threshold_is_not_flagged(self):
+        response = self.inspect(5)
+        self.assertEqual((response['X-Query-Count'], response['X-Query-Repeated']), ('5', '0'))
@@ -0,0 +1,121 @@
+# chat/archive.py
+"""
+Cold storage for old chat messages.
+
+``manage.py archive_messages`` moves a room's oldest messages out of
+chat_message into segment files under CHAT_ARCHIVE_ROOT, one
+ArchivedSegment row per file. A segment is a header followed by
+length-prefixed records in id order:
+
+    [payload length: u32][message id: u64][zlib(JSON [sender_id, timestamp, is_deleted, text])]
+
+Readers mmap the file, walk the fixed-size record headers to find the ids
+they need, and only decompress those. Segments are never rewritten;
+messages deleted after archiving are listed in ArchivedSegment.deleted_ids.
+"""
+from datetime import datetime
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import zlib
+
+from django.conf import settings
+
+from .models import ArchivedSegment, Message
+
+MAGIC = b'BSMSEG1\n'
+RECORD = struct.Struct('>IQ')
+
+
+def segment_path(segment):
+    return Path(settings.CHAT_ARCHIVE_ROOT) / segment.path
+
+
+def write_segment(path, messages):
+    """Write ``messages`` (ordered by id) to ``path`` atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        for m in messages:
+            payload = zlib.compress(json.dumps([
+                m.sender_id,
+                m.timestamp.isoformat(),
+                m.is_deleted,
+                '' if m.is_deleted else m.text,
+            ]).encode())
+            f.write(RECORD.pack(len(payload), m.id))
+            f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _records(buf):
+    """(message id, payload offset, payload length) for every record in a mapped segment."""
+    if buf[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a message segment")
+    records, pos = [], len(MAGIC)
+    while pos < len(buf):
+        length, message_id = RECORD.unpack_from(buf, pos)
+        pos += RECORD.size
+        records.append((message_id, pos, length))
+        pos += length
+    return records
+
+
+def _message(segment, deleted, message_id, payload):
+    sender_id, timestamp, is_deleted, text = json.loads(zlib.decompress(payload))
+    is_deleted = is_deleted or message_id in deleted
+    return Message(
+        id=message_id,
+        chat_id=segment.chat_id,
+        sender_id=sender_id,
+        text='' if is_deleted else text,
+        timestamp=datetime.fromisoformat(timestamp),
+        is_deleted=is_deleted,
+    )
+
+
+def read_segment(segment, before_id=None, limit=None, only_id=None):
+    """Messages from one segment, newest first, below ``before_id`` and at most ``limit``."""
+    with open(segment_path(segment), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        records = _records(buf)
+        if only_id is not None:
+            records = [r for r in records if r[0] == only_id]
+        if before_id is not None:
+            records = [r for r in records if r[0] < before_id]
+        deleted = set(segment.deleted_ids)
+        return [
+            _message(segment, deleted, message_id, buf[start:start + length])
+            for message_id, start, length in records[::-1][:limit]
+        ]
+
+
+def archived_messages(chat, before_id=None, limit=50):
+    """The newest archived messages of ``chat`` below ``before_id``, newest first."""
+    segments = ArchivedSegment.objects.filter(chat=chat).order_by('-last_id')
+    if before_id is not None:
+        segments = segments.filter(first_id__lt=before_id)
+
+    messages = []
+    for segment in segments:
+        messages.extend(read_segment(segment, before_id, limit - len(messages)))
+        if len(messages) >= limit:
+            break
+    return messages
+
+
+def find_archived(message_id, chat_ids):
+    """(segment, Message) for an archived message id in one of ``chat_ids``, or (None, None)."""
+    # Id ranges of different rooms' segments can overlap
+    segments = ArchivedSegment.objects.filter(
+        chat_id__in=chat_ids, first_id__lte=message_id, last_id__gte=message_id,
+    )
+    for segment in segments:
+        found = read_segment(segment, only_id=message_id)
+        if found:
+            return segment, found[0]
+    return None, None
@@ -0,0 +1,99 @@
+# chat/broadcast.py
+"""
+Pub/sub hub that pushes chat events to connected WebSockets.
+
+Views publish from worker threads; sockets subscribe from the event loop.
+The backend comes from the CHAT_BROADCAST setting. InMemoryBroadcast only
+reaches sockets served by the same process; a shared backend (Redis, etc.)
+can replace it by implementing Broadcast.
+"""
+import asyncio
+from collections import defaultdict
+from functools import lru_cache
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Sent to a subscriber that fell behind, so it refetches instead
+RESYNC = {'type': 'resync'}
+
+
+def room_channel(match_id):
+    return f'chat.{match_id}'
+
+
+class Subscription:
+    """One socket's queue; create and read it on the event loop."""
+
+    def __init__(self, channel, queue_size):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broadcast:
+    """Backend interface. ``publish`` must be safe to call from any thread."""
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+
+class InMemoryBroadcast(Broadcast):
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel, self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Loop already closed; the socket is gone
+                self.unsubscribe(subscription)
+
+
+@lru_cache(maxsize=None)
+def get_broadcast():
+    config = settings.CHAT_BROADCAST
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def publish(match_id, event):
+    """Publish ``event`` to a chat room once the current transaction commits."""
+    transaction.on_commit(lambda: get_broadcast().publish(room_channel(match_id), event))
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from chat.archive import write_segment
+from chat.models import ArchivedSegment, ChatRoom, Message
+
+
+class Command(BaseCommand):
+    help = (
+        "Move chat messages older than a cutoff out of chat_message into "
+        "compressed per-room segment files under CHAT_ARCHIVE_ROOT."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_AFTER_DAYS,
+                            help="Archive messages older than this many days.")
+        parser.add_argument('--segment-size', type=int, default=5000,
+                            help="Most messages per segment file.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        size = options['segment_size']
+        root = Path(settings.CHAT_ARCHIVE_ROOT)
+
+        segments = archived = 0
+        for room in ChatRoom.objects.filter(messages__timestamp__lt=cutoff).distinct():
+            # Archive a prefix by id, so every archived message is older than every hot one
+            last_id = Message.objects.filter(chat=room, timestamp__lt=cutoff).aggregate(last=Max('id'))['last']
+            while True:
+                batch = list(Message.objects.filter(chat=room, id__lte=last_id).order_by('id')[:size])
+                if not batch:
+                    break
+                relative = Path(str(room.id)) / f'{batch[0].id}-{batch[-1].id}.seg'
+                path = root / relative
+                write_segment(path, batch)
+                try:
+                    with transaction.atomic():
+                        # A write first, so SQLite holds the write lock from here to the delete
+                        segment = ArchivedSegment.objects.create(
+                            chat=room,
+                            path=str(relative),
+                            first_id=batch[0].id,
+                            last_id=batch[-1].id,
+                            message_count=len(batch),
+                        )
+                        archived_rows = Message.objects.select_for_update().filter(
+                            chat=room, id__gte=batch[0].id, id__lte=batch[-1].id,
+                        )
+                        # Deleted since the batch was read; the file still has their text
+                        written_live = [m.id for m in batch if not m.is_deleted]
+                        segment.deleted_ids = list(archived_rows.filter(
+                            id__in=written_live, is_deleted=True,
+                        ).values_list('id', flat=True))
+                        if segment.deleted_ids:
+                            segment.save(update_fields=['deleted_ids'])
+                        archived_rows.delete()
+                except Exception:
+                    path.unlink(missing_ok=True)
+                    raise
+                segments += 1
+                archived += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} messages into {segments} segments."))
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_read_cursors(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    ReadCursor = apps.get_model('chat', 'ReadCursor')
+
+    cursors = []
+    for room in ChatRoom.objects.select_related('match'):
+        messages = list(Message.objects.filter(chat=room).order_by('id').values_list('id', 'sender_id', 'is_read'))
+        for user_id in (room.match.user_a_id, room.match.user_b_id):
+            # Read up to just before the first unread message from the other side
+            unread = [mid for mid, sender_id, is_read in messages if sender_id != user_id and not is_read]
+            last_read = unread[0] - 1 if unread else (messages[-1][0] if messages else 0)
+            cursors.append(ReadCursor(
+                chat=room,
+                user_id=user_id,
+                last_read_message_id=last_read,
+                unread_count=sum(1 for mid, sender_id, _ in messages if sender_id != user_id and mid > last_read),
+            ))
+    ReadCursor.objects.bulk_create(cursors)
+
+
+def fill_is_read(apps, schema_editor):
+    Message = apps.get_model('chat', 'Message')
+    ReadCursor = apps.get_model('chat', 'ReadCursor')
+    for cursor in ReadCursor.objects.all():
+        Message.objects.filter(
+            chat_id=cursor.chat_id, id__lte=cursor.last_read_message_id
+        ).exclude(sender_id=cursor.user_id).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_versions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.PositiveBigIntegerField(default=0)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to='chat.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_cursors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('chat', 'user'), name='unique_read_cursor')],
+            },
+        ),
+        migrations.RunPython(fill_read_cursors, fill_is_read),
+    ]
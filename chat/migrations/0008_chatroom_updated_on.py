@@ -0,0 +1,40 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:20
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_updated_on(apps, schema_editor):
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Match = apps.get_model('match', 'Match')
+    ReadCursor = apps.get_model('chat', 'ReadCursor')
+
+    # The inbox lists rooms, so every match needs one
+    for match in Match.objects.filter(chatroom__isnull=True):
+        room = ChatRoom.objects.create(match=match)
+        ReadCursor.objects.bulk_create(
+            [ReadCursor(chat=room, user_id=user_id) for user_id in (match.user_a_id, match.user_b_id)]
+        )
+
+    rooms = list(ChatRoom.objects.annotate(last_message_on=Max('messages__timestamp')))
+    for room in rooms:
+        room.updated_on = room.last_message_on or room.created_on
+    ChatRoom.objects.bulk_update(rooms, ['updated_on'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_remove_message_is_read'),
+        ('match', '0005_top_matches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='updated_on',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(fill_updated_on, migrations.RunPython.noop),
+    ]
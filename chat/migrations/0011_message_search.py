@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:05
+
+from django.db import migrations
+
+# External-content FTS5 index over live (not deleted) message text, kept in sync by triggers
+CREATE = [
+    """
+    CREATE VIRTUAL TABLE chat_message_fts USING fts5(
+        text, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_ai AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, text) SELECT new.id, new.text WHERE NOT new.is_deleted;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_au AFTER UPDATE OF text, is_deleted ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, text)
+            SELECT 'delete', old.id, old.text WHERE NOT old.is_deleted;
+        INSERT INTO chat_message_fts(rowid, text) SELECT new.id, new.text WHERE NOT new.is_deleted;
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_ad AFTER DELETE ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, text)
+            SELECT 'delete', old.id, old.text WHERE NOT old.is_deleted;
+    END
+    """,
+    "INSERT INTO chat_message_fts(rowid, text) SELECT id, text FROM chat_message WHERE NOT is_deleted",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_ai",
+    "DROP TRIGGER IF EXISTS chat_message_fts_au",
+    "DROP TRIGGER IF EXISTS chat_message_fts_ad",
+    "DROP TABLE IF EXISTS chat_message_fts",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # FTS5 is SQLite-only; elsewhere chat.search falls back to LIKE
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_archived_segments'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(CREATE), _run(DROP)),
+    ]
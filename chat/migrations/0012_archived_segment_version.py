@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_message_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedsegment',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='archivedsegment',
+            index=models.Index(fields=['chat', 'version'], name='segment_chat_version_idx'),
+        ),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import Count
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.conf import settings
 from match.models import Match
 
@@ -10,27 +13,96 @@ User = settings.AUTH_USER_MODEL
 class ChatRoom(models.Model):
     match = models.OneToOneField('match.Match', on_delete=models.CASCADE, related_name='chatroom')
     created_on = models.DateTimeField(auto_now_add=True)
+    # Goes up on every message send or delete; polling clients send the last one they saw
+    version = models.PositiveBigIntegerField(default=0)
+    # Time of the last send or delete; orders the inbox and drives its change feed
+    updated_on = models.DateTimeField(default=timezone.now, db_index=True)
 
     def __str__(self):
         return f"ChatRoom for {self.match}"
 
+    def bump_version(self):
+        """Increment and return the room version; call inside a transaction."""
+        ChatRoom.objects.filter(pk=self.pk).update(version=models.F('version') + 1, updated_on=timezone.now())
+        self.version = ChatRoom.objects.values_list('version', flat=True).get(pk=self.pk)
+        return self.version
+
 
 class Message(models.Model):
     chat = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
-    
+    # Room version of the last change to this message (sent or deleted)
+    version = models.PositiveBigIntegerField(default=0)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['chat', 'version'], name='message_version_idx'),
+            # History pages and delta polls walk a chat by id
+            models.Index(fields=['chat', 'id'], name='message_chat_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender} → {self.text[:25]}"
 
 
+class ReadCursor(models.Model):
+    """How far one participant has read a chat; their messages up to here are read."""
+    chat = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_cursors')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='read_cursors')
+    last_read_message_id = models.PositiveBigIntegerField(default=0)
+    # Messages from the other participant after the cursor; bumped on send
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['chat', 'user'], name='unique_read_cursor')]
+
+    def __str__(self):
+        return f"{self.user} read {self.chat} up to {self.last_read_message_id}"
+
+    @classmethod
+    def advance(cls, chat, user_id, message_id):
+        """
+        Move the user's cursor forward to ``message_id`` and recount what is left.
+
+        One UPDATE that matches nothing if the cursor is already there.
+        """
+        left = Message.objects.filter(chat=chat, id__gt=message_id).exclude(sender_id=user_id)
+        return cls.objects.filter(chat=chat, user_id=user_id, last_read_message_id__lt=message_id).update(
+            last_read_message_id=message_id,
+            unread_count=Coalesce(
+                models.Subquery(left.order_by().values('chat').annotate(n=Count('id')).values('n')), 0
+            ),
+        )
+
+
+class ArchivedSegment(models.Model):
+    """A file of a room's oldest messages, moved out of chat_message (see chat.archive)."""
+    chat = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='archived_segments')
+    # Relative to CHAT_ARCHIVE_ROOT
+    path = models.CharField(max_length=255, unique=True)
+    first_id = models.PositiveBigIntegerField()
+    last_id = models.PositiveBigIntegerField()
+    message_count = models.PositiveIntegerField()
+    # Messages deleted after archiving; segment files are never rewritten
+    deleted_ids = models.JSONField(default=list)
+    # Room version of the latest tombstone, so delta polls can pick it up
+    version = models.PositiveBigIntegerField(default=0)
+    created_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat', 'last_id'], name='segment_chat_last_idx'),
+            models.Index(fields=['chat', 'version'], name='segment_chat_version_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.chat} messages {self.first_id}-{self.last_id}"
+
+
 class RevealRequest(models.Model):
     match = models.ForeignKey(Match, on_delete=models.CASCADE)
     requester = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -0,0 +1,121 @@
+# chat/search.py
+"""
+Message search across the caller's chats.
+
+On SQLite this queries the chat_message_fts FTS5 index (migration
+0011_message_search), ranked by bm25 with highlighted snippets. Other
+databases fall back to a LIKE scan, newest first. Archived messages are
+not searchable.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+
+from blindspark.cursors import decode_cursor, encode_cursor
+from .models import ChatRoom, Message
+
+# Control characters can't appear in typed queries, so they are safe snippet markers
+_OPEN, _CLOSE = '\x02', '\x03'
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+SNIPPET_TOKENS = 12
+
+
+def fts_query(text):
+    """
+    An FTS5 MATCH expression for free text: every word must appear, the
+    last one as a prefix. None if there are no words.
+    """
+    terms = _TERM.findall(text)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def highlight(snippet):
+    """Escape a snippet and turn its match markers into <mark> tags."""
+    return escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def _room_ids(user, chat_id=None):
+    rooms = ChatRoom.objects.filter(Q(match__user_a=user) | Q(match__user_b=user), match__is_active=True)
+    if chat_id is not None:
+        rooms = rooms.filter(id=chat_id)
+    return list(rooms.values_list('id', flat=True))
+
+
+def search_messages(user, text, chat_id=None, cursor=None, limit=20):
+    """
+    One page of ``user``'s messages matching ``text``, best first.
+
+    Returns ``(results, next_cursor)``; results are dicts with id,
+    chat_id, sender_id, timestamp and an HTML ``snippet``. Pages are keyed
+    on (rank, id). Raises ValueError for a malformed cursor.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    room_ids = _room_ids(user, chat_id)
+    if not room_ids:
+        return [], None
+    if connection.vendor == 'sqlite':
+        rows = _fts_search(text, room_ids, after, limit + 1)
+    else:
+        rows = like_search(text, room_ids, after, limit + 1)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['rank'], rows[-1]['id'])
+    return rows, next_cursor
+
+
+def _fts_search(text, room_ids, after, limit):
+    match = fts_query(text)
+    if match is None:
+        return []
+
+    placeholders = ', '.join(['%s'] * len(room_ids))
+    params = [_OPEN, _CLOSE, SNIPPET_TOKENS, match, *room_ids]
+    keyset = ''
+    if after:
+        keyset = 'AND (bm25(chat_message_fts) > %s OR (bm25(chat_message_fts) = %s AND m.id > %s))'
+        params += [after[0], after[0], after[1]]
+
+    messages = Message.objects.raw(
+        f"""
+        SELECT m.id, m.chat_id, m.sender_id, m.timestamp,
+               snippet(chat_message_fts, 0, %s, %s, '…', %s) AS snippet,
+               bm25(chat_message_fts) AS rank
+        FROM chat_message_fts
+        JOIN chat_message m ON m.id = chat_message_fts.rowid
+        WHERE chat_message_fts MATCH %s
+          AND m.chat_id IN ({placeholders})
+          {keyset}
+        ORDER BY bm25(chat_message_fts), m.id
+        LIMIT {int(limit)}
+        """,
+        params,
+    )
+    return [_result(m, highlight(m.snippet), m.rank) for m in messages]
+
+
+def _result(message, snippet, rank):
+    return {
+        'id': message.id,
+        'chat_id': message.chat_id,
+        'sender_id': message.sender_id,
+        'timestamp': message.timestamp,
+        'snippet': snippet,
+        'rank': rank,
+    }
+
+
+def like_search(text, room_ids, after, limit):
+    # Without FTS every hit ranks the same, so pages run newest first by id
+    messages = Message.objects.filter(chat_id__in=room_ids, is_deleted=False, text__icontains=text.strip())
+    if after:
+        messages = messages.filter(id__lt=after[1])
+    return [_result(m, escape(m.text[:200]), 0.0) for m in messages.order_by('-id')[:limit]]
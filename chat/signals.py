@@ -0,0 +1,15 @@
+# chat/signals.py
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import ChatRoom, ReadCursor
+
+
+@receiver(post_save, sender=ChatRoom)
+def create_read_cursors(sender, instance, created, **kwargs):
+    if created:
+        match = instance.match
+        ReadCursor.objects.bulk_create(
+            [ReadCursor(chat=instance, user_id=user_id) for user_id in (match.user_a_id, match.user_b_id)],
+            ignore_conflicts=True,
+        )
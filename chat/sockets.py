@@ -0,0 +1,108 @@
+# chat/sockets.py
+"""
+Plain ASGI WebSocket endpoint, ``/ws/chat/<match_id>/``.
+
+Authenticates from the session cookie, subscribes to the room on the
+broadcast hub and forwards its events as JSON. Clients only listen;
+anything they send is ignored.
+"""
+import asyncio
+from importlib import import_module
+import json
+import re
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections
+from django.db.models import Q
+from django.http.cookie import parse_cookie
+from django.http.request import validate_host
+
+from match.models import Match
+from .broadcast import get_broadcast, room_channel
+
+ROOM_PATH = re.compile(r'^/ws/chat/(?P<match_id>\d+)/$')
+
+# Close codes in the application range, mirroring HTTP statuses
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+
+def _headers(scope):
+    return {name.decode('latin1'): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def _origin_allowed(headers):
+    # Browsers always send Origin; reject pages on other hosts (cross-site WebSocket hijacking)
+    origin = headers.get('origin')
+    if origin is None:
+        return True
+    allowed = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed:
+        allowed = ['.localhost', '127.0.0.1', '[::1]']
+    return validate_host(urlsplit(origin).hostname or '', allowed)
+
+
+def _authorize(headers, match_id):
+    """Id of the session's user if they are in the match, else None."""
+    close_old_connections()
+    try:
+        cookies = parse_cookie(headers.get('cookie', ''))
+        session = import_module(settings.SESSION_ENGINE).SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+        user = get_user(SimpleNamespace(session=session))
+        if not user.is_authenticated:
+            return None
+        is_member = Match.objects.filter(
+            Q(user_a_id=user.id) | Q(user_b_id=user.id), id=match_id, is_active=True
+        ).exists()
+        return user.id if is_member else None
+    finally:
+        close_old_connections()
+
+
+def for_viewer(event, user_id):
+    """Replace the event's ``sender`` with ``mine`` for this socket's user."""
+    if 'sender' not in event:
+        return event
+    event = dict(event)
+    event['mine'] = event.pop('sender') == user_id
+    if 'message' in event:
+        event['message'] = {**event['message'], 'mine': event['mine']}
+    return event
+
+
+async def chat_socket(scope, receive, send):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+
+    route = ROOM_PATH.match(scope['path'])
+    if route is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+
+    headers = _headers(scope)
+    match_id = int(route['match_id'])
+    user_id = await sync_to_async(_authorize)(headers, match_id) if _origin_allowed(headers) else None
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+
+    hub = get_broadcast()
+    subscription = hub.subscribe(room_channel(match_id))
+    await send({'type': 'websocket.accept'})
+
+    async def forward():
+        while True:
+            event = await subscription.get()
+            await send({'type': 'websocket.send', 'text': json.dumps(for_viewer(event, user_id))})
+
+    forwarding = asyncio.ensure_future(forward())
+    try:
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+    finally:
+        forwarding.cancel()
+        hub.unsubscribe(subscription)
@@ -1,3 +1,373 @@
-from django.test import TestCase
+import asyncio
+from datetime import timedelta
+from io import StringIO
+import json
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.budget import Endpoint, EndpointBudgetTestCase, build_fixture
+from blindspark.asgi import application
+from match.models import Match
+from .archive import archived_messages, write_segment
+from .broadcast import get_broadcast
+from .models import ArchivedSegment, ChatRoom, Message, ReadCursor, RevealRequest
+from .search import search_messages
+
+
+class ChatEndpointBudgetTests(EndpointBudgetTestCase):
+    urlconf = 'chat.urls'
+    endpoints = {
+        'chatroom': Endpoint(args=lambda f: [f.chatroom.match_id]),
+        'fetch_messages': Endpoint(args=lambda f: [f.chatroom.id]),
+        'wait_messages': Endpoint(
+            args=lambda f: [f.chatroom.id],
+            data=lambda f: {'after_id': f.own_message.id, 'since': f.chatroom.version, 'timeout': 0},
+        ),
+        'send_message': Endpoint(args=lambda f: [f.chatroom.id], method='post', data=lambda f: {'text': "Hi"}),
+        'chat_list': Endpoint(),
+        # Every room in the fixture changed within the hour
+        'chat_list_changes': Endpoint(data=lambda f: {'since': (timezone.now() - timedelta(hours=1)).isoformat()}),
+        'delete_message': Endpoint(args=lambda f: [f.own_message.id], method='post'),
+        'request_reveal': Endpoint(args=lambda f: [f.chatroom.match_id], method='post'),
+        'accept_reveal': Endpoint(args=lambda f: [f.chatroom.match_id], method='post'),
+        'unread_count_api': Endpoint(),
+        'search_messages': Endpoint(data=lambda f: {'q': "Message"}),
+    }
+
+
+class FetchMessageChangesTests(TestCase):
+    def setUp(self):
+        self.fixture = build_fixture(10)
+        self.other = RevealRequest.objects.get().requester
+        self.url = reverse('chat:fetch_messages', args=[self.fixture.chatroom.id])
+        self.client.force_login(self.fixture.viewer)
+
+    def test_idle_poll_is_empty(self):
+        full = self.client.get(self.url).json()
+        with self.assertNumQueries(2):  # user stamp and room; session and user row come from the cache
+            data = self.client.get(self.url, {'after_id': full['last_id'], 'since': full['version']}).json()
+        self.assertEqual(data, {
+            'messages': [], 'changes': [], 'version': full['version'], 'read_up_to': full['read_up_to'],
+        })
+
+    def test_returns_new_messages_and_deletions(self):
+        full = self.client.get(self.url).json()
+        chat = self.fixture.chatroom
+        chat.refresh_from_db()
+        with transaction.atomic():
+            new = Message.objects.create(chat=chat, sender=self.other, text="<b>new</b>", version=chat.bump_version())
+        self.client.post(reverse('chat:delete_message', args=[self.fixture.own_message.id]))
+
+        data = self.client.get(self.url, {'after_id': full['last_id'], 'since': full['version']}).json()
+        self.assertEqual([m['id'] for m in data['messages']], [new.id])
+        self.assertEqual(data['messages'][0]['text'], "<b>new</b>")
+        self.assertFalse(data['messages'][0]['mine'])
+        self.assertEqual(data['changes'], [{'id': self.fixture.own_message.id, 'deleted': True}])
+        cursor = ReadCursor.objects.get(chat=chat, user=self.fixture.viewer)
+        self.assertEqual((cursor.last_read_message_id, cursor.unread_count), (new.id, 0))
+
+    def test_invalid_after_id(self):
+        response = self.client.get(self.url, {'after_id': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChatPushTests(TestCase):
+    def setUp(self):
+        self.fixture = build_fixture(10)
+        self.match = self.fixture.chatroom.match
+        self.client.force_login(self.fixture.viewer)
+
+    def connect(self, cookie=True):
+        headers = [(b'origin', b'http://testserver')]
+        if cookie:
+            headers.append((b'cookie', f'sessionid={self.client.cookies["sessionid"].value}'.encode()))
+        return ApplicationCommunicator(application, {
+            'type': 'websocket', 'path': f'/ws/chat/{self.match.id}/', 'headers': headers,
+        })
+
+    def send(self, text):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('chat:send_message', args=[self.fixture.chatroom.id]), {'text': text})
+
+    async def test_anonymous_is_rejected(self):
+        socket = self.connect(cookie=False)
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual(await socket.receive_output(1), {'type': 'websocket.close', 'code': 4403})
+
+    async def test_send_is_pushed(self):
+        socket = self.connect()
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(1))['type'], 'websocket.accept')
+
+        await sync_to_async(self.send)("Hi")
+
+        event = json.loads((await socket.receive_output(1))['text'])
+        self.assertEqual(event['type'], 'message')
+        self.assertTrue(event['mine'])
+        self.assertEqual(event['message']['text'], "Hi")
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(1)
+        self.assertFalse(get_broadcast()._subscribers)
+
+    async def test_long_poll_wakes_on_send(self):
+        await self.async_client.aforce_login(self.fixture.viewer)
+        url = reverse('chat:wait_messages', args=[self.fixture.chatroom.id])
+        params = {'after_id': self.fixture.own_message.id, 'since': self.fixture.chatroom.version, 'timeout': 5}
+        waiting = asyncio.ensure_future(self.async_client.get(url, params))
+        await asyncio.sleep(0.1)
+        self.assertFalse(waiting.done())
+
+        await sync_to_async(self.send)("Hi")
+        data = (await asyncio.wait_for(waiting, 1)).json()
+        self.assertEqual([m['text'] for m in data['messages']], ["Hi"])
+
+    async def test_long_poll_timeout_answers_like_delta_fetch(self):
+        await self.async_client.aforce_login(self.fixture.viewer)
+        params = {'after_id': self.fixture.own_message.id, 'since': self.fixture.chatroom.version}
+        fetched = (await self.async_client.get(
+            reverse('chat:fetch_messages', args=[self.fixture.chatroom.id]), params,
+        )).json()
+        waited = (await self.async_client.get(
+            reverse('chat:wait_messages', args=[self.fixture.chatroom.id]), {**params, 'timeout': 0},
+        )).json()
+        self.assertEqual(waited, fetched)
+        self.assertIn('read_up_to', waited)
+
+
+class ReadCursorTests(TestCase):
+    def setUp(self):
+        self.fixture = build_fixture(10)
+        self.chat = self.fixture.chatroom
+        self.other = RevealRequest.objects.get().requester
+
+    def cursor(self, user):
+        return ReadCursor.objects.get(chat=self.chat, user=user)
+
+    def test_send_counts_unread_and_fetch_clears_it(self):
+        self.client.force_login(self.other)
+        self.client.post(reverse('chat:send_message', args=[self.chat.id]), {'text': "Hi"})
+        before = self.cursor(self.fixture.viewer).unread_count
+
+        self.client.force_login(self.fixture.viewer)
+        self.client.get(reverse('chat:fetch_messages', args=[self.chat.id]))
+        after = self.cursor(self.fixture.viewer)
+        self.assertEqual(after.unread_count, 0)
+        self.assertEqual(after.last_read_message_id, self.chat.messages.order_by('-id').first().id)
+        self.assertGreater(before, 0)
+
+    def test_read_chat_does_not_write(self):
+        self.client.force_login(self.fixture.viewer)
+        url = reverse('chat:fetch_messages', args=[self.chat.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+
+    def test_unread_total_is_cached_until_send(self):
+        cache.clear()
+        self.client.force_login(self.fixture.viewer)
+        url = reverse('chat:unread_count_api')
+        before = self.client.get(url).json()['unread_count']
+        with self.assertNumQueries(1):  # user stamp; session, user row and total come from the cache
+            self.client.get(url)
+
+        self.client.force_login(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('chat:send_message', args=[self.chat.id]), {'text': "Hi"})
+        self.client.force_login(self.fixture.viewer)
+        self.assertEqual(self.client.get(url).json()['unread_count'], before + 1)
+
+
+class ChatListChangesTests(TestCase):
+    def setUp(self):
+        self.fixture = build_fixture(10)
+        self.client.force_login(self.fixture.viewer)
+        self.url = reverse('chat:chat_list_changes')
+
+    def test_idle_feed_is_empty_and_send_shows_up(self):
+        since = self.client.get(reverse('chat:chat_list')).context['since']
+        ChatRoom.objects.update(updated_on=timezone.now() - timedelta(minutes=5))
+
+        data = self.client.get(self.url, {'since': since}).json()
+        self.assertEqual(data['items'], [])
+
+        room = self.fixture.matches[-1].chatroom
+        self.client.post(reverse('chat:send_message', args=[room.id]), {'text': "Back again"})
+        data = self.client.get(self.url, {'since': data['since']}).json()
+        self.assertEqual([item['id'] for item in data['items']], [room.id])
+        self.assertIn("Back again", data['items'][0]['html'])
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+
+
+@override_settings(CHAT_HISTORY_PAGE_SIZE=3)
+class HistoryWindowTests(TestCase):
+    def setUp(self):
+        self.fixture = build_fixture(30)
+        self.client.force_login(self.fixture.viewer)
+        self.url = reverse('chat:fetch_messages', args=[self.fixture.chatroom.id])
+
+    def test_latest_window_then_older_pages(self):
+        ids = list(self.fixture.chatroom.messages.order_by('id').values_list('id', flat=True))
+        self.assertEqual(len(ids), 4)
+
+        latest = self.client.get(self.url).json()
+        self.assertEqual((latest['first_id'], latest['last_id'], latest['has_more']), (ids[1], ids[3], True))
+
+        older = self.client.get(self.url, {'before_id': latest['first_id']}).json()
+        self.assertEqual((older['first_id'], older['messages_count'], older['has_more']), (ids[0], 1, False))
+        self.assertNotIn('version', older)
+
+    def test_invalid_before_id(self):
+        self.assertEqual(self.client.get(self.url, {'before_id': 'x'}).status_code, 400)
+
+    def test_delete_rerenders_cached_bubble(self):
+        caches['template_fragments'].clear()
+        self.assertIn("Mine", self.client.get(self.url).json()['html'])
+
+        self.client.post(reverse('chat:delete_message', args=[self.fixture.own_message.id]))
+        html = self.client.get(self.url).json()['html']
+        self.assertNotIn("Mine", html)
+        self.assertIn("This message was deleted", html)
+
+
+@override_settings(CHAT_HISTORY_PAGE_SIZE=3)
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.settings_override = override_settings(CHAT_ARCHIVE_ROOT=self.root.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        caches['template_fragments'].clear()
+
+        self.fixture = build_fixture(30)
+        self.chat = self.fixture.chatroom
+        self.ids = list(self.chat.messages.order_by('id').values_list('id', flat=True))
+        # All but the newest message are two years old
+        Message.objects.filter(id__in=self.ids[:-1]).update(timestamp=timezone.now() - timedelta(days=730))
+        call_command('archive_messages', segment_size=2, stdout=StringIO())
+
+        self.client.force_login(self.fixture.viewer)
+        self.url = reverse('chat:fetch_messages', args=[self.chat.id])
+
+    def test_history_reads_through_to_archive(self):
+        self.assertEqual(list(self.chat.messages.values_list('id', flat=True)), self.ids[-1:])
+        self.assertEqual(ArchivedSegment.objects.filter(chat=self.chat).count(), 2)
+
+        latest = self.client.get(self.url).json()
+        self.assertEqual((latest['first_id'], latest['last_id'], latest['has_more']), (self.ids[1], self.ids[3], True))
+        older = self.client.get(self.url, {'before_id': latest['first_id']}).json()
+        self.assertEqual((older['first_id'], older['has_more']), (self.ids[0], False))
+
+    def test_delete_archived_message_leaves_tombstone(self):
+        # Fixture messages alternate senders: the other user's first, then the viewer's
+        theirs, mine = self.ids[0], self.ids[1]
+        def delete(message_id):
+            return self.client.post(reverse('chat:delete_message', args=[message_id]))
+
+        self.assertEqual(delete(theirs).status_code, 403)
+        before = self.client.get(self.url).json()
+        self.assertEqual(delete(mine).status_code, 200)
+
+        # Delta polls see the tombstone too, not just sockets
+        delta = {'after_id': before['last_id'], 'since': before['version']}
+        self.assertEqual(self.client.get(self.url, delta).json()['changes'], [{'id': mine, 'deleted': True}])
+
+        # Other people's rooms aren't searched at all
+        self.client.force_login(self.fixture.stranger)
+        self.assertEqual(delete(theirs).status_code, 404)
+        self.client.force_login(self.fixture.viewer)
+
+        self.assertEqual(ArchivedSegment.objects.get(first_id=theirs).deleted_ids, [mine])
+        html = self.client.get(self.url, {'before_id': self.ids[2]}).json()['html']
+        self.assertIn("Message 0", html)
+        self.assertNotIn("Message 1", html)
+        self.assertIn("This message was deleted", html)
+
+    def test_delete_while_archiving_is_kept(self):
+        room = self.fixture.matches[1].chatroom
+        ids = list(room.messages.order_by('id').values_list('id', flat=True))
+        room.messages.update(timestamp=timezone.now() - timedelta(days=730))
+
+        def write_then_delete(path, batch):
+            write_segment(path, batch)
+            # delete_message lands after the batch was read, before it is removed
+            Message.objects.filter(id=ids[1]).update(is_deleted=True)
+
+        with mock.patch('chat.management.commands.archive_messages.write_segment', write_then_delete):
+            call_command('archive_messages', stdout=StringIO())
+
+        segment = ArchivedSegment.objects.get(chat=room)
+        self.assertEqual(segment.deleted_ids, [ids[1]])
+        self.assertEqual([m.is_deleted for m in archived_messages(room)[::-1]], [False, True, False])
+
+
+class MessageSearchTests(TestCase):
+    def setUp(self):
+        self.fixture = build_fixture(20)
+        self.viewer = self.fixture.viewer
+        self.chat = self.fixture.chatroom
+        self.client.force_login(self.viewer)
+        self.url = reverse('chat:search_messages')
+
+    def search(self, q, **params):
+        return self.client.get(self.url, {'q': q, **params}).json()
+
+    def test_ranked_snippet_is_highlighted_and_escaped(self):
+        Message.objects.create(chat=self.chat, sender=self.viewer, text="<b>Coffee</b> on Sunday?")
+        results = self.search("sun")['results']
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0]['mine'])
+        self.assertEqual(results[0]['chat_id'], self.chat.id)
+        self.assertEqual(results[0]['snippet'], "&lt;b&gt;Coffee&lt;/b&gt; on <mark>Sunday</mark>?")
+
+    def test_deleted_and_other_peoples_messages_are_not_found(self):
+        mine = Message.objects.create(chat=self.chat, sender=self.viewer, text="pizza tonight")
+        # A chat the viewer isn't part of
+        match = self.fixture.matches[0]
+        partner = match.user_b if match.user_a == self.viewer else match.user_a
+        elsewhere = ChatRoom.objects.create(match=Match.objects.create(
+            user_a=partner, user_b=self.fixture.stranger, compatibility_score=50,
+        ))
+        Message.objects.create(chat=elsewhere, sender=self.fixture.stranger, text="pizza tonight")
+        self.assertEqual([r['id'] for r in self.search("pizza")['results']], [mine.id])
+
+        self.client.post(reverse('chat:delete_message', args=[mine.id]))
+        self.assertEqual(self.search("pizza")['results'], [])
+
+    def test_cursor_pages_through_every_hit_once(self):
+        ids = {Message.objects.create(chat=self.chat, sender=self.viewer, text=f"pasta {'pasta ' * i}").id
+               for i in range(5)}
+        seen, cursor = [], None
+        while True:
+            page, cursor = search_messages(self.viewer, "pasta", cursor=cursor, limit=2)
+            seen += [r['id'] for r in page]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(ids))
+
+        only = self.search("pasta", chat=self.fixture.matches[1].chatroom.id)
+        self.assertEqual(only['results'], [])
+        self.assertEqual(self.client.get(self.url, {'q': "pasta", 'cursor': "bogus"}).status_code, 400)
+
+    def test_rebuild_restores_the_index(self):
+        message = Message.objects.create(chat=self.chat, sender=self.viewer, text="salsa class")
+        Message.objects.create(chat=self.chat, sender=self.viewer, text="salsa night", is_deleted=True)
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO chat_message_fts(chat_message_fts) VALUES ('delete-all')")
+        self.assertEqual(self.search("salsa")['results'], [])
+
+        call_command('rebuild_message_index', stdout=StringIO())
+        self.assertEqual([r['id'] for r in self.search("salsa")['results']], [message.id])
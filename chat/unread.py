@@ -0,0 +1,27 @@
+# chat/unread.py
+"""Per-user unread message totals, cached until a send or read changes them."""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from .models import ReadCursor
+
+
+def _cache_key(user_id):
+    return f'chat:unread:{user_id}'
+
+
+def unread_total(user_id):
+    """Unread messages across the user's active matches; one aggregate query on a miss."""
+    key = _cache_key(user_id)
+    total = cache.get(key)
+    if total is None:
+        total = ReadCursor.objects.filter(user_id=user_id, chat__match__is_active=True).aggregate(
+            total=Sum('unread_count')
+        )['total'] or 0
+        cache.set(key, total, settings.UNREAD_CACHE_TTL)
+    return total
+
+
+def invalidate_unread(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
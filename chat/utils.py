@@ -0,0 +1,117 @@
+# chat/utils.py
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateformat import format as date_format
+
+from .models import ChatRoom, Message, ReadCursor
+
+
+def day_label(day, today):
+    """Date separator text, as rendered by chat/_messages.html."""
+    if day == today:
+        return "Today"
+    if day == today - timedelta(days=1):
+        return "Yesterday"
+    return date_format(day, "M j, Y")
+
+
+def serialize_message(message, user_id, today):
+    """Compact JSON form of a message for polling clients."""
+    local = timezone.localtime(message.timestamp)
+    data = {
+        'id': message.id,
+        'mine': message.sender_id == user_id,
+        'deleted': message.is_deleted,
+        'date': local.date().isoformat(),
+        'day': day_label(local.date(), today),
+        'time': local.strftime('%H:%M'),
+    }
+    if not message.is_deleted:
+        data['text'] = message.text
+    return data
+
+
+def message_days(messages):
+    """
+    Group messages (oldest first) into local-date blocks for chat/_messages.html.
+
+    A block's fragment cache key includes its first and last ids and how
+    many of its messages are deleted, so a send or delete in that day
+    (archived messages included) renders it afresh.
+    """
+    days = []
+    for m in messages:
+        day = timezone.localtime(m.timestamp).date()
+        if not days or days[-1]['date'] != day:
+            days.append({'date': day, 'messages': []})
+        days[-1]['messages'].append(m)
+    for day in days:
+        day['first_id'] = day['messages'][0].id
+        day['last_id'] = day['messages'][-1].id
+        day['deleted'] = sum(m.is_deleted for m in day['messages'])
+    return days
+
+
+def forget_bubbles(message):
+    """Drop the cached bubbles (chat/_messages.html) rendered before ``message`` was deleted."""
+    caches['template_fragments'].delete_many([
+        make_template_fragment_key('chat_bubble', [message.id, False, side]) for side in ('me', 'them')
+    ])
+
+
+def read_positions(chat, user_id):
+    """(user's last read message id, the other participant's) for a chat, in one query."""
+    cursors = dict(ReadCursor.objects.filter(chat=chat).values_list('user_id', 'last_read_message_id'))
+    mine = cursors.pop(user_id, 0)
+    return mine, max(cursors.values(), default=0)
+
+
+def with_read_positions(rooms, user_id):
+    """Annotate ChatRooms with ``my_last_read`` and ``read_up_to`` (the other participant's cursor)."""
+    cursors = ReadCursor.objects.filter(chat=OuterRef('pk')).values('last_read_message_id')
+    return rooms.annotate(
+        my_last_read=Subquery(cursors.filter(user_id=user_id)[:1]),
+        read_up_to=Subquery(cursors.exclude(user_id=user_id)[:1]),
+    )
+
+
+def inbox(user):
+    """
+    The user's chat rooms, newest activity first, in one query.
+
+    Each room carries both users, its last message (``last_text``,
+    ``last_sender_id``, ``last_timestamp``, ``last_deleted``) and the
+    user's ``unread`` count.
+    """
+    last = Message.objects.filter(chat=OuterRef('pk')).order_by('-id')
+    unread = ReadCursor.objects.filter(chat=OuterRef('pk'), user=user).values('unread_count')
+    return ChatRoom.objects.filter(
+        Q(match__user_a=user) | Q(match__user_b=user), match__is_active=True
+    ).select_related('match__user_a', 'match__user_b').annotate(
+        last_text=Subquery(last.values('text')[:1]),
+        last_sender_id=Subquery(last.values('sender_id')[:1]),
+        last_timestamp=Subquery(last.values('timestamp')[:1]),
+        last_deleted=Subquery(last.values('is_deleted')[:1]),
+        unread=Subquery(unread[:1]),
+    ).order_by('-updated_on', '-id')
+
+
+def inbox_item(room, user):
+    """Template context for one chat_list row."""
+    match = room.match
+    return {
+        'room': room,
+        'other': match.user_b if match.user_a_id == user.id else match.user_a,
+        'last_msg': {
+            'text': room.last_text,
+            'sender_id': room.last_sender_id,
+            'timestamp': room.last_timestamp,
+            'is_deleted': room.last_deleted,
+        } if room.last_timestamp else None,
+        'unread': room.unread or 0,
+        'can_see_photo': match.is_friend,
+    }
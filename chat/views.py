@@ -1,4 +1,9 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
@@ -6,18 +11,30 @@ from django.urls import reverse
 from django.http import JsonResponse, Http404, HttpResponseForbidden
 from django.core.paginator import Paginator
 from django.utils import timezone
-from datetime import date
+from django.utils.dateparse import parse_datetime
+from datetime import date, timedelta
 
 from users.models import User
+from users.photos import photo_variant
 from match.models import Match  # <-- import Match from your match app
-from .models import ChatRoom, Message,RevealRequest  # <-- import Message as well
+from .models import ArchivedSegment, ChatRoom, Message, ReadCursor, RevealRequest  # <-- import Message as well
+from .archive import archived_messages, find_archived
+from .broadcast import get_broadcast, publish, room_channel
+from .search import search_messages as find_messages
+from .unread import invalidate_unread, unread_total
+from .utils import (
+    day_label, forget_bubbles, inbox, inbox_item, message_days, read_positions, serialize_message, with_read_positions,
+)
 from django.db import models
-from django.db.models import Q
+from django.db.models import F, Q
 from django.views.decorators.http import require_POST
 
 
 # Create your views here.
 
+# How far back chat_list_changes re-reads, to cover transactions that commit out of order
+CHAT_LIST_OVERLAP = timedelta(seconds=2)
+
 
 @login_required
 def chatroom(request, match_id):
@@ -30,11 +47,8 @@ def chatroom(request, match_id):
     other_user = match.user_b if request.user == match.user_a else match.user_a
 
     # Mark messages as read
-    Message.objects.filter(
-        chat=chatroom,
-        sender=other_user,
-        is_read=False
-    ).update(is_read=True)
+    newest = chatroom.messages.order_by('-id').values_list('id', flat=True).first()
+    _mark_read(chatroom, request.user.id, newest)
 
     reveal_request = RevealRequest.objects.filter(
         match=match,
@@ -47,8 +61,7 @@ def chatroom(request, match_id):
     ).exists()
 
     # Add today and yesterday for date separators
-    from datetime import date, timedelta
-    today = date.today()
+    today = timezone.localdate()
     yesterday = today - timedelta(days=1)
 
     return render(request, 'chat/chatroom.html', {
@@ -64,39 +77,161 @@ def chatroom(request, match_id):
 
 @login_required
 def fetch_messages(request, chat_id):
-    chat = get_object_or_404(ChatRoom, id=chat_id)
+    """
+    The latest CHAT_HISTORY_PAGE_SIZE messages as HTML.
 
-    if request.user not in (chat.match.user_a, chat.match.user_b):
-        return HttpResponseForbidden()
+    With ``before_id``, the page just before that message instead, for
+    loading older history on scroll.
+    """
+    if 'after_id' in request.GET:
+        return fetch_message_changes(request, chat_id)
 
-    other_user = chat.match.user_b if request.user == chat.match.user_a else chat.match.user_a
+    try:
+        before_id = int(request.GET['before_id']) if 'before_id' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid before_id'}, status=400)
 
-    # ✅ Mark new messages from the other user as read
-    Message.objects.filter(
-        chat=chat,
-        sender=other_user,
-        is_read=False
-    ).update(is_read=True)
+    chat = get_object_or_404(ChatRoom.objects.select_related('match'), id=chat_id)
+
+    if request.user.id not in (chat.match.user_a_id, chat.match.user_b_id):
+        return HttpResponseForbidden()
+
+    # Newest first over the (chat, id) index; one extra row says whether there is more
+    size = settings.CHAT_HISTORY_PAGE_SIZE
+    page = chat.messages.order_by('-id')
+    if before_id is not None:
+        page = page.filter(id__lt=before_id)
+    msgs = list(page[:size + 1])
+    if len(msgs) <= size:
+        # Scrolled past the hot table; continue from the archive
+        boundary = msgs[-1].id if msgs else before_id
+        msgs += archived_messages(chat, boundary, size + 1 - len(msgs))
+    has_more = len(msgs) > size
+    msgs = msgs[:size][::-1]
 
     # Add today and yesterday for date separators
-    from datetime import date, timedelta
-    today = date.today()
+    today = timezone.localdate()
     yesterday = today - timedelta(days=1)
 
-    msgs = chat.messages.select_related('sender')
     html = render(request, 'chat/_messages.html', {
-        'messages': msgs,
+        'days': message_days(msgs),
         'user': request.user,
         'today': today,
-        'yesterday': yesterday
+        'yesterday': yesterday,
+        'fragment_ttl': settings.CHAT_FRAGMENT_CACHE_TTL,
     }).content.decode()
 
-    return JsonResponse({
+    data = {
         'html': html,
-        'messages_count': msgs.count(),
+        'messages_count': len(msgs),
+        'first_id': msgs[0].id if msgs else None,
+        'has_more': has_more,
+    }
+    if before_id is None:
+        # ✅ Mark new messages from the other user as read
+        data.update(
+            last_id=msgs[-1].id if msgs else 0,
+            version=chat.version,
+            read_up_to=_mark_read(chat, request.user.id, msgs[-1].id if msgs else None),
+        )
+    return JsonResponse(data)
+
+
+def _mark_read(chat, user_id, newest):
+    """Move the user's read cursor to ``newest``; returns the other side's cursor."""
+    last_read, read_up_to = read_positions(chat, user_id)
+    if newest and newest > last_read and ReadCursor.advance(chat, user_id, newest):
+        invalidate_unread(user_id)
+    return read_up_to
+
+
+def fetch_message_changes(request, chat_id):
+    """
+    Delta poll: messages after ``after_id`` plus changes to older ones since ``since``.
+
+    ``since`` is the room version the client last saw. When nothing has
+    changed the poll is one indexed lookup and returns empty lists.
+    """
+    try:
+        after_id = int(request.GET['after_id'])
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid after_id or since'}, status=400)
+
+    rooms = with_read_positions(ChatRoom.objects.select_related('match'), request.user.id)
+    chat = get_object_or_404(rooms, id=chat_id)
+    if request.user.id not in (chat.match.user_a_id, chat.match.user_b_id):
+        return HttpResponseForbidden()
+
+    read_up_to = chat.read_up_to or 0
+    if chat.version <= since:
+        return JsonResponse({'messages': [], 'changes': [], 'version': chat.version, 'read_up_to': read_up_to})
+
+    new = list(chat.messages.filter(id__gt=after_id).order_by('id'))
+    changed = [
+        {'id': m.id, 'deleted': m.is_deleted}
+        for m in chat.messages.filter(id__lte=after_id, version__gt=since).order_by('id')
+    ]
+    # Archived messages carry no version; their segment records the last tombstone's
+    tombstones = chat.archived_segments.filter(version__gt=since).values_list('deleted_ids', flat=True)
+    changed = [{'id': i, 'deleted': True} for ids in tombstones for i in ids] + changed
+
+    # Everything delivered here is now read; one cursor write, only if it moves
+    if new and new[-1].id > (chat.my_last_read or 0):
+        if ReadCursor.advance(chat, request.user.id, new[-1].id):
+            invalidate_unread(request.user.id)
+
+    today = timezone.localdate()
+    return JsonResponse({
+        'messages': [serialize_message(m, request.user.id, today) for m in new],
+        'changes': changed,
+        'version': chat.version,
+        'read_up_to': read_up_to,
     })
 
 
+@login_required
+async def wait_messages(request, chat_id):
+    """
+    Long-poll variant of the delta fetch for clients without WebSockets.
+
+    Parks on the room's broadcast channel until something is published or
+    ``timeout`` seconds pass, then answers exactly like the delta fetch,
+    empty lists on a timeout. Under ASGI a parked request holds no thread
+    and no database query.
+    """
+    try:
+        int(request.GET['after_id'])
+        since = int(request.GET.get('since', 0))
+        timeout = min(float(request.GET.get('timeout', settings.CHAT_LONG_POLL_TIMEOUT)),
+                      settings.CHAT_LONG_POLL_TIMEOUT)
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'Invalid after_id, since or timeout'}, status=400)
+
+    user = await request.auser()
+    chat = await ChatRoom.objects.select_related('match').filter(id=chat_id).afirst()
+    if chat is None:
+        raise Http404
+    if user.id not in (chat.match.user_a_id, chat.match.user_b_id):
+        return HttpResponseForbidden()
+
+    hub = get_broadcast()
+    subscription = hub.subscribe(room_channel(chat.match_id))
+    try:
+        # Re-read after subscribing, so a change in between isn't missed
+        version = await ChatRoom.objects.filter(id=chat_id).values_list('version', flat=True).aget()
+        if version <= since:
+            try:
+                await asyncio.wait_for(subscription.get(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                # Still answered by the delta fetch, which adds read_up_to
+                pass
+    finally:
+        hub.unsubscribe(subscription)
+
+    return await sync_to_async(fetch_message_changes)(request, chat_id)
+
+
 
 @login_required
 def send_message(request, chat_id):
@@ -107,63 +242,106 @@ def send_message(request, chat_id):
 
         text = request.POST.get('text', '').strip()
         if text:
-            Message.objects.create(
-                chat=chat,
-                sender=request.user,
-                text=text,
-                is_read=False  # ← New message = unread for receiver
-            )
+            with transaction.atomic():
+                msg = Message.objects.create(
+                    chat=chat,
+                    sender=request.user,
+                    text=text,
+                    version=chat.bump_version(),
+                )
+                # ← New message = unread for receiver
+                ReadCursor.objects.filter(chat=chat).exclude(user=request.user).update(
+                    unread_count=F('unread_count') + 1
+                )
+                other_id = chat.match.user_b_id if request.user.id == chat.match.user_a_id else chat.match.user_a_id
+                transaction.on_commit(lambda: invalidate_unread(other_id))
+                publish(chat.match_id, {
+                    'type': 'message',
+                    'sender': request.user.id,
+                    'message': serialize_message(msg, request.user.id, timezone.localdate()),
+                    'version': msg.version,
+                })
         return JsonResponse({'success': True})
     return JsonResponse({'error': 'Invalid'}, status=400)
 
 
 @login_required
 def chat_list(request):
-    matches = Match.objects.filter(
-        is_active=True
-    ).filter(
-        models.Q(user_a=request.user) | models.Q(user_b=request.user)
-    ).select_related('user_a', 'user_b')
-
-    chatrooms = []
-    for m in matches:
-        room, _ = ChatRoom.objects.get_or_create(match=m)
-        other_user = m.user_b if m.user_a == request.user else m.user_a
-        last_msg = Message.objects.filter(chat=room).order_by('-timestamp').first()
-
-        # Unread count (simple)
-        unread = Message.objects.filter(
-            chat=room,
-            sender=other_user,
-            is_read=False  # ← Only unread
-        ).count()
-
-        chatrooms.append({
-            "room": room,
-            "other": other_user,
-            "last_msg": last_msg,
-            "unread": unread,
-            "can_see_photo": m.is_friend
-        })
-
+    chatrooms = [inbox_item(room, request.user) for room in inbox(request.user)]
     return render(request, 'chat/chat_list.html', {
-        'chatrooms': chatrooms
+        'chatrooms': chatrooms,
+        'since': timezone.now().isoformat(),
     })
 
 
+@login_required
+def chat_list_changes(request):
+    """
+    Inbox rows for rooms updated after ``since`` (an ISO timestamp from the last response).
+
+    Re-reads a short overlap window, so a send that committed after a
+    later one is not skipped.
+    """
+    since = parse_datetime(request.GET.get('since', ''))
+    if since is None:
+        return JsonResponse({'error': 'Invalid since'}, status=400)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+
+    now = timezone.now()
+    rooms = inbox(request.user).filter(updated_on__gt=since - CHAT_LIST_OVERLAP)
+    items = [
+        {
+            'id': room.id,
+            'html': render_to_string('chat/_chat_item.html', {'c': inbox_item(room, request.user)}, request),
+        }
+        for room in rooms
+    ]
+    return JsonResponse({'items': items, 'since': now.isoformat()})
+
+
 @login_required
 @require_POST
 def delete_message(request, message_id):
-    msg = get_object_or_404(Message, id=message_id)
-    if msg.sender != request.user:
+    msg = Message.objects.select_related('chat').filter(id=message_id).first()
+    if msg is None:
+        return _delete_archived_message(request, message_id)
+    if msg.sender_id != request.user.id:
         return JsonResponse({'error': 'Not your message'}, status=403)
 
-    msg.is_deleted = True
-    msg.save(update_fields=['is_deleted'])
+    with transaction.atomic():
+        msg.is_deleted = True
+        msg.version = msg.chat.bump_version()
+        msg.save(update_fields=['is_deleted', 'version'])
+        transaction.on_commit(lambda: forget_bubbles(msg))
+        publish(msg.chat.match_id, {'type': 'delete', 'id': msg.id, 'version': msg.version})
     return JsonResponse({'success': True})
 
 
 
+def _delete_archived_message(request, message_id):
+    # Only the caller's rooms, so unknown ids don't open other rooms' files
+    rooms = ChatRoom.objects.filter(Q(match__user_a=request.user) | Q(match__user_b=request.user))
+    segment, msg = find_archived(message_id, rooms.values_list('id', flat=True))
+    if msg is None:
+        raise Http404
+    if msg.sender_id != request.user.id:
+        return JsonResponse({'error': 'Not your message'}, status=403)
+
+    # Segment files are immutable; record a tombstone instead
+    with transaction.atomic():
+        segment = ArchivedSegment.objects.select_for_update().get(pk=segment.pk)
+        chat = ChatRoom.objects.get(pk=segment.chat_id)
+        version = chat.bump_version()
+        if message_id not in segment.deleted_ids:
+            segment.deleted_ids.append(message_id)
+        segment.version = version
+        segment.save(update_fields=['deleted_ids', 'version'])
+        transaction.on_commit(lambda: forget_bubbles(msg))
+        publish(chat.match_id, {'type': 'delete', 'id': message_id, 'version': version})
+    return JsonResponse({'success': True})
+
+
 @login_required
 def request_reveal(request, match_id):
     match = get_object_or_404(Match, id=match_id)
@@ -174,7 +352,9 @@ def request_reveal(request, match_id):
         return JsonResponse({'already': True})
 
     # Create request
-    RevealRequest.objects.get_or_create(match=match, requester=request.user)
+    _, created = RevealRequest.objects.get_or_create(match=match, requester=request.user)
+    if created:
+        publish(match.id, {'type': 'reveal_requested', 'sender': request.user.id})
     return JsonResponse({'requested': True})
 
 
@@ -190,22 +370,46 @@ def accept_reveal(request, match_id):
     if not match.is_friend:
         match.is_friend = True
         match.save(update_fields=['is_friend'])
+        # Clear photos are only sent once revealed; each side takes the other's
+        photos = {user.id: photo_variant(user, 'sm', True) for user in (match.user_a, match.user_b)}
+        publish(match.id, {'type': 'reveal_accepted', 'sender': request.user.id, 'photos': photos})
 
     RevealRequest.objects.filter(match=match, requester=other_user).delete()
-    return JsonResponse({'accepted': True, 'unblurred': True})
+    return JsonResponse({'accepted': True, 'unblurred': True, 'photo': photo_variant(other_user, 'sm', True)})
 
 
 @login_required
 def unread_count_api(request):
-    total_unread = 0
-    matches = Match.objects.filter(is_active=True).filter(
-        Q(user_a=request.user) | Q(user_b=request.user)
-    )
-    for m in matches:
-        room = ChatRoom.objects.filter(match=m).first()
-        if room:
-            other = m.user_b if m.user_a == request.user else m.user_a
-            unread = Message.objects.filter(chat=room, sender=other, is_read=False).count()
-            total_unread += unread
-
-    return JsonResponse({"unread_count": total_unread})
\ No newline at end of file
+    return JsonResponse({"unread_count": unread_total(request.user.id)})
+
+
+@login_required
+def search_messages(request):
+    """Ranked search over the caller's chats, optionally one chat; paged by ``cursor``."""
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'results': [], 'cursor': None})
+    try:
+        chat_id = int(request.GET['chat']) if request.GET.get('chat') else None
+        results, next_cursor = find_messages(request.user, query, chat_id, request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid chat or cursor'}, status=400)
+
+    today = timezone.localdate()
+    return JsonResponse({
+        'results': [_search_result(r, request.user.id, today) for r in results],
+        'cursor': next_cursor,
+    })
+
+
+def _search_result(result, user_id, today):
+    local = timezone.localtime(result['timestamp'])
+    return {
+        'id': result['id'],
+        'chat_id': result['chat_id'],
+        'mine': result['sender_id'] == user_id,
+        'date': local.date().isoformat(),
+        'day': day_label(local.date(), today),
+        'time': local.strftime("%H:%M"),
+        'snippet': result['snippet'],
+    }
@@ -4,3 +4,5 @@ from django.apps import AppConfig
 class MatchConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'match'
+    def ready(self):
+        import match.signals
@@ -0,0 +1,197 @@
+# matches/feed.py
+from datetime import date, timedelta
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from blindspark.cursors import decode_cursor, encode_cursor
+from users.models import User
+from users.utils import cells_covering, nearby_user_ids
+from .models import DiscoveryFeed, DiscoveryFeedEntry, DiscoveryLog, Like, TopMatch
+from .utils import batch_match_scores, calculate_match_score, haversine_km, DISCOVERY_RADIUS_KM
+
+# Candidates below this score are left out of the feed
+MIN_FEED_SCORE = 10
+# TopMatch rows only seed a feed while they still fill a discover page
+MIN_SEEDED_FEED = 9
+
+
+def opposite_gender(gender):
+    return {'M': 'F', 'F': 'M'}.get(gender)
+
+
+def adult_cutoff():
+    today = date.today()
+    return today.replace(year=today.year - 18)
+
+
+def discovery_candidates(user):
+    """Users that may appear in ``user``'s discovery feed."""
+    # Only users 18+
+    potential = User.objects.exclude(id=user.id).filter(
+        dob__isnull=False,
+        dob__lte=adult_cutoff(),
+    )
+
+    # Filter by opposite gender if set
+    if opposite_gender(user.gender):
+        potential = potential.filter(gender=opposite_gender(user.gender))
+
+    # Only users in the cells around the viewer; loc_score is 0 beyond this radius.
+    # Users without a location still qualify (they get the neutral loc_score).
+    if user.latitude and user.longitude:
+        potential = potential.filter(
+            Q(id__in=nearby_user_ids(user.latitude, user.longitude, DISCOVERY_RADIUS_KM))
+            | Q(geo_cell__isnull=True)
+        )
+
+    # Exclude users already viewed or liked
+    viewed_ids = DiscoveryLog.objects.filter(viewer=user).values_list('viewed_user_id', flat=True)
+    liked_ids = Like.objects.filter(from_user=user).values_list('to_user_id', flat=True)
+    return potential.exclude(id__in=viewed_ids).exclude(id__in=liked_ids)
+
+
+def _is_candidate(viewer, candidate):
+    # Same rules as discovery_candidates, for one pair already in memory
+    if not candidate.dob or candidate.dob > adult_cutoff():
+        return False
+    if opposite_gender(viewer.gender) and candidate.gender != opposite_gender(viewer.gender):
+        return False
+    if viewer.latitude and viewer.longitude and candidate.geo_cell is not None:
+        return candidate.geo_cell in cells_covering(viewer.latitude, viewer.longitude, DISCOVERY_RADIUS_KM)
+    return True
+
+
+def _live_rows(user, candidates):
+    """(candidate_id, score, distance) for ``candidates`` worth showing, scored now."""
+    ids, scores, distances = batch_match_scores(user, candidates)
+    relevant = scores >= MIN_FEED_SCORE
+    return [
+        (candidate_id, score, None if math.isnan(distance) else round(distance, 1))
+        for candidate_id, score, distance in zip(
+            ids[relevant].tolist(), scores[relevant].tolist(), distances[relevant].tolist()
+        )
+    ]
+
+
+@transaction.atomic
+def build_feed(user):
+    """
+    Replace ``user``'s stored feed.
+
+    Fresh TopMatch rows computed for the user's current profile pick the
+    candidates the feed starts with, plus users who joined after the run;
+    only those are scored, live, so candidates' own edits since the run
+    count. Such a feed is marked incomplete and extend_feed() adds the
+    rest of the candidates when the viewer reaches its end. Once the seed
+    can't fill a page, e.g. the viewer has opened most of it, every
+    candidate is scored now instead.
+    """
+    fresh_since = timezone.now() - timedelta(seconds=settings.TOP_MATCHES_MAX_AGE)
+    top = TopMatch.objects.filter(
+        user=user, profile_version=user.profile_version, computed_on__gte=fresh_since,
+    )
+    # Still subject to the live rules, e.g. candidates viewed or liked since the run
+    candidates = discovery_candidates(user)
+    rows, complete = [], True
+    computed_on = top.aggregate(oldest=Min('computed_on'))['oldest']
+    if computed_on is not None:
+        seeded = candidates.filter(Q(id__in=top.values('candidate_id')) | Q(date_joined__gte=computed_on))
+        rows = _live_rows(user, seeded)
+        complete = len(rows) < MIN_SEEDED_FEED
+    if complete:
+        rows = _live_rows(user, candidates)
+
+    DiscoveryFeedEntry.objects.filter(viewer=user).delete()
+    DiscoveryFeedEntry.objects.bulk_create(
+        DiscoveryFeedEntry(viewer=user, candidate_id=candidate_id, score=score, distance=distance)
+        for candidate_id, score, distance in rows
+    )
+    DiscoveryFeed.objects.update_or_create(
+        viewer=user, defaults={'built_on': timezone.now(), 'complete': complete},
+    )
+
+
+@transaction.atomic
+def extend_feed(user):
+    """
+    Add the candidates a seeded feed left out, scored now.
+
+    Returns False if ``user``'s feed already had everyone. Candidates that
+    now outscore the seed rank above the viewer's cursor and only show up
+    after the next rebuild.
+    """
+    if not DiscoveryFeed.objects.filter(viewer=user, complete=False).update(complete=True):
+        return False
+    listed = DiscoveryFeedEntry.objects.filter(viewer=user).values('candidate_id')
+    DiscoveryFeedEntry.objects.bulk_create(
+        DiscoveryFeedEntry(viewer=user, candidate_id=candidate_id, score=score, distance=distance)
+        for candidate_id, score, distance in _live_rows(user, discovery_candidates(user).exclude(id__in=listed))
+    )
+    return True
+
+
+def get_feed(user):
+    """``user``'s ranked feed entries, rebuilding the feed if missing or stale."""
+    fresh_since = timezone.now() - timedelta(seconds=settings.DISCOVERY_FEED_TTL)
+    if not DiscoveryFeed.objects.filter(viewer=user, built_on__gte=fresh_since).exists():
+        build_feed(user)
+    return DiscoveryFeedEntry.objects.filter(viewer=user).order_by('-score', 'candidate_id')
+
+
+def feed_page(feed, cursor=None, size=9):
+    """
+    One page of ``feed`` after ``cursor``, as ``(entries, next_cursor)``.
+
+    Pages are keyed on (score, candidate_id), so each is a bounded index
+    scan and rows dropped from the feed never shift later pages.
+    ``next_cursor`` is None on the last page.
+    """
+    if cursor:
+        score, candidate_id = decode_cursor(cursor)
+        feed = feed.filter(Q(score__lt=score) | Q(score=score, candidate_id__gt=candidate_id))
+    entries = list(feed[:size + 1])
+    if len(entries) <= size:
+        return entries, None
+    entries = entries[:size]
+    return entries, encode_cursor(entries[-1].score, entries[-1].candidate_id)
+
+
+def drop_from_feed(viewer_id, candidate_id):
+    DiscoveryFeedEntry.objects.filter(viewer_id=viewer_id, candidate_id=candidate_id).delete()
+
+
+def invalidate_feed(user):
+    """Force ``user``'s own feed to be rebuilt on their next discovery request."""
+    DiscoveryFeed.objects.filter(viewer=user).delete()
+
+
+@transaction.atomic
+def rescore_candidate(user):
+    """
+    Refresh the feed rows that show ``user`` after they edit their profile.
+
+    Only the rows where ``user`` is the candidate are touched: scores are
+    recomputed, and rows whose viewer should no longer see them are dropped.
+    """
+    entries = list(
+        DiscoveryFeedEntry.objects.filter(candidate=user).select_related('viewer')
+    )
+    changed, dropped = [], []
+    for entry in entries:
+        viewer = entry.viewer
+        score = calculate_match_score(viewer, user)
+        if score < MIN_FEED_SCORE or not _is_candidate(viewer, user):
+            dropped.append(entry.id)
+            continue
+        distance = None
+        if all([viewer.latitude, viewer.longitude, user.latitude, user.longitude]):
+            distance = round(haversine_km(viewer.latitude, viewer.longitude, user.latitude, user.longitude), 1)
+        entry.score, entry.distance = score, distance
+        changed.append(entry)
+
+    DiscoveryFeedEntry.objects.filter(id__in=dropped).delete()
+    DiscoveryFeedEntry.objects.bulk_update(changed, ['score', 'distance'])
@@ -0,0 +1,73 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from match.models import TopMatchRun
+from match.precompute import list_shards, compute_shard, save_shard, init_worker
+
+
+class Command(BaseCommand):
+    help = "Precompute every user's top-K matches into match.TopMatch, sharded by gender and geo cell."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=50, help="Matches to keep per user.")
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help="Worker processes; 0 computes in this process.",
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help="Continue the latest unfinished run instead of starting a new one.",
+        )
+
+    def handle(self, *args, **options):
+        run = None
+        if options['resume']:
+            run = TopMatchRun.objects.filter(finished_on__isnull=True).order_by('-started_on').first()
+            if run is None:
+                self.stdout.write("No unfinished run to resume; starting a new one.")
+        if run is None:
+            run = TopMatchRun.objects.create(k=options['k'])
+
+        done = set(run.shards.values_list('gender', 'geo_cell'))
+        todo = [shard for shard in list_shards() if shard not in done]
+        self.stdout.write(
+            f"Run {run.id}: {len(todo)} shards to score, {len(done)} already done, k={run.k}."
+        )
+
+        started, pairs = time.monotonic(), 0
+        for i, result in enumerate(self._results(todo, run.k, options['workers']), start=1):
+            save_shard(run, result)
+            pairs += result['pairs']
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f"[{i}/{len(todo)}] gender={result['gender'] or '-'} cell={result['geo_cell']} "
+                f"users={len(result['viewer_ids'])} pairs={result['pairs']} "
+                f"({pairs / elapsed if elapsed else 0:,.0f} pairs/s)"
+            )
+
+        elapsed = time.monotonic() - started
+        run.pairs_scored = sum(run.shards.values_list('pairs_scored', flat=True))
+        run.finished_on = timezone.now()
+        run.save(update_fields=['pairs_scored', 'finished_on'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {pairs:,} pairs in {elapsed:.1f}s "
+            f"({pairs / elapsed if elapsed else 0:,.0f} pairs/s)."
+        ))
+
+    def _results(self, shards, k, workers):
+        if not workers:
+            for gender, geo_cell in shards:
+                yield compute_shard(gender, geo_cell, k)
+            return
+
+        # Workers open their own connections; don't let them inherit ours
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            futures = [pool.submit(compute_shard, gender, geo_cell, k) for gender, geo_cell in shards]
+            for future in as_completed(futures):
+                yield future.result()
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('match', '0004_discovery_feed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopMatchRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('k', models.PositiveIntegerField()),
+                ('started_on', models.DateTimeField(auto_now_add=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('pairs_scored', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TopMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('distance', models.FloatField(blank=True, null=True)),
+                ('rank', models.PositiveIntegerField()),
+                ('profile_version', models.PositiveIntegerField()),
+                ('computed_on', models.DateTimeField()),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='top_matches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['user', 'rank'],
+                'indexes': [models.Index(fields=['user', 'rank'], name='top_match_rank_idx')],
+                'unique_together': {('user', 'candidate')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TopMatchShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gender', models.CharField(blank=True, max_length=20)),
+                ('geo_cell', models.IntegerField(blank=True, null=True)),
+                ('users', models.PositiveIntegerField(default=0)),
+                ('pairs_scored', models.PositiveBigIntegerField(default=0)),
+                ('finished_on', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='match.topmatchrun')),
+            ],
+            options={
+                'unique_together': {('run', 'gender', 'geo_cell')},
+            },
+        ),
+    ]
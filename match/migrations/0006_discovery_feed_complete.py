@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('match', '0005_top_matches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discoveryfeed',
+            name='complete',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -48,4 +48,73 @@ class Like(models.Model):
 
     @property
     def is_mutual(self):
-        return Like.objects.filter(from_user=self.to_user, to_user=self.from_user).exists()
\ No newline at end of file
+        return Like.objects.filter(from_user=self.to_user, to_user=self.from_user).exists()
+
+
+class DiscoveryFeed(models.Model):
+    """Marks when a viewer's ranked feed (DiscoveryFeedEntry rows) was last built."""
+    viewer = models.OneToOneField(User, on_delete=models.CASCADE, related_name='discovery_feed')
+    built_on = models.DateTimeField()
+    # False while only seeded from TopMatch; see match.feed.extend_feed
+    complete = models.BooleanField(default=True)
+
+    def __str__(self):
+        return f"Feed for {self.viewer} ({self.built_on:%Y-%m-%d %H:%M})"
+
+
+class DiscoveryFeedEntry(models.Model):
+    viewer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='in_feeds')
+    score = models.FloatField()
+    distance = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('viewer', 'candidate')
+        ordering = ['-score', 'candidate_id']
+        indexes = [models.Index(fields=['viewer', '-score', 'candidate'], name='feed_rank_idx')]
+
+    def __str__(self):
+        return f"{self.viewer} → {self.candidate} ({self.score:.1f}%)"
+
+
+class TopMatchRun(models.Model):
+    """One run of the precompute_top_matches command."""
+    k = models.PositiveIntegerField()
+    started_on = models.DateTimeField(auto_now_add=True)
+    finished_on = models.DateTimeField(null=True, blank=True)
+    pairs_scored = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Top-{self.k} run {self.started_on:%Y-%m-%d %H:%M}"
+
+
+class TopMatchShard(models.Model):
+    """A (gender, geo cell) shard finished by a run, so interrupted runs can resume."""
+    run = models.ForeignKey(TopMatchRun, on_delete=models.CASCADE, related_name='shards')
+    gender = models.CharField(max_length=20, blank=True)
+    geo_cell = models.IntegerField(null=True, blank=True)
+    users = models.PositiveIntegerField(default=0)
+    pairs_scored = models.PositiveBigIntegerField(default=0)
+    finished_on = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('run', 'gender', 'geo_cell')
+
+
+class TopMatch(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='top_matches')
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    distance = models.FloatField(null=True, blank=True)
+    rank = models.PositiveIntegerField()
+    # user.profile_version the row was computed for; a later edit makes it stale
+    profile_version = models.PositiveIntegerField()
+    computed_on = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        ordering = ['user', 'rank']
+        indexes = [models.Index(fields=['user', 'rank'], name='top_match_rank_idx')]
+
+    def __str__(self):
+        return f"{self.user} #{self.rank}: {self.candidate} ({self.score:.1f}%)"
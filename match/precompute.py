@@ -0,0 +1,148 @@
+# matches/precompute.py
+"""
+Offline top-K matches, computed by the precompute_top_matches command.
+
+Users are sharded by (gender, geo_cell): every viewer in a shard shares
+the same candidate pool, so the pool is loaded once per shard and each
+viewer is scored against it with the NumPy engine in match/utils.py.
+Shards run in worker processes; only the parent process writes results.
+"""
+import math
+
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from users.models import User
+from users.utils import cells_covering, pack_interest_masks
+from .feed import MIN_FEED_SCORE, adult_cutoff, opposite_gender
+from .models import DiscoveryLog, Like, TopMatch, TopMatchShard
+from .utils import score_arrays, round_scores, DISCOVERY_RADIUS_KM
+
+
+def list_shards():
+    """Every (gender, geo_cell) pair that has at least one user."""
+    shards = set(User.objects.order_by().values_list('gender', 'geo_cell').distinct())
+    return sorted(shards, key=lambda s: (s[0], -1 if s[1] is None else s[1]))
+
+
+def init_worker():
+    # Never share the parent's database connection with a forked worker
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _exclusions(viewer_ids):
+    excluded = {viewer_id: set() for viewer_id in viewer_ids}
+    for viewer_id, other_id in DiscoveryLog.objects.filter(
+        viewer_id__in=viewer_ids
+    ).values_list('viewer_id', 'viewed_user_id'):
+        excluded[viewer_id].add(other_id)
+    for viewer_id, other_id in Like.objects.filter(
+        from_user_id__in=viewer_ids
+    ).values_list('from_user_id', 'to_user_id'):
+        excluded[viewer_id].add(other_id)
+    return excluded
+
+
+def _top_k(totals, k):
+    """Indexes of candidates that can still make the top ``k`` once scores are rounded."""
+    shortlist = np.flatnonzero(totals >= MIN_FEED_SCORE - 0.01)
+    if len(shortlist) > k:
+        kth = np.partition(totals[shortlist], -k)[-k]
+        shortlist = shortlist[totals[shortlist] >= kth - 0.01]
+    return shortlist
+
+
+def compute_shard(gender, geo_cell, k):
+    """
+    Top-``k`` candidates for every user in one shard.
+
+    Applies the same candidate rules as ``match.feed.discovery_candidates``
+    and returns a dict of plain values so it can cross process boundaries.
+    """
+    viewers = list(
+        User.objects.filter(gender=gender, geo_cell=geo_cell) if geo_cell is not None
+        else User.objects.filter(gender=gender, geo_cell__isnull=True)
+    )
+
+    # Candidate pool shared by the shard: adults of the opposite gender near any viewer
+    pool = User.objects.filter(dob__isnull=False, dob__lte=adult_cutoff())
+    if opposite_gender(gender):
+        pool = pool.filter(gender=opposite_gender(gender))
+    viewer_cells = {}
+    for viewer in viewers:
+        if viewer.latitude and viewer.longitude:
+            viewer_cells[viewer.id] = cells_covering(viewer.latitude, viewer.longitude, DISCOVERY_RADIUS_KM)
+    if viewers and len(viewer_cells) == len(viewers):
+        nearby = set().union(*viewer_cells.values())
+        pool = pool.filter(Q(geo_cell__in=nearby) | Q(geo_cell__isnull=True))
+
+    rows = list(pool.order_by().values_list('id', 'latitude', 'longitude', 'interest_mask', 'geo_cell'))
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lats = np.array([r[1] for r in rows], dtype=float)
+    lons = np.array([r[2] for r in rows], dtype=float)
+    masks = pack_interest_masks([r[3] for r in rows])
+    cells = np.array([r[4] for r in rows], dtype=float)  # None -> nan
+
+    excluded = _exclusions([viewer.id for viewer in viewers])
+    results, pairs = [], 0
+    for viewer in viewers:
+        selected = ids != viewer.id
+        if viewer.id in viewer_cells:
+            selected &= np.isin(cells, viewer_cells[viewer.id]) | np.isnan(cells)
+        if excluded[viewer.id]:
+            selected &= ~np.isin(ids, list(excluded[viewer.id]))
+        selected = np.flatnonzero(selected)
+        pairs += len(selected)
+
+        totals, distances = score_arrays(viewer, lats[selected], lons[selected], masks[selected])
+        shortlist = _top_k(totals, k)
+        scores = round_scores(totals[shortlist])
+        candidate_ids = ids[selected][shortlist]
+        keep = scores >= MIN_FEED_SCORE
+        order = np.lexsort((candidate_ids[keep], -scores[keep]))[:k]
+        for rank, (candidate_id, score, distance) in enumerate(zip(
+            candidate_ids[keep][order].tolist(),
+            scores[keep][order].tolist(),
+            distances[shortlist][keep][order].tolist(),
+        ), start=1):
+            results.append((
+                viewer.id, candidate_id, score,
+                None if math.isnan(distance) else round(distance, 1),
+                rank, viewer.profile_version,
+            ))
+
+    return {
+        'gender': gender,
+        'geo_cell': geo_cell,
+        'viewer_ids': [viewer.id for viewer in viewers],
+        'pairs': pairs,
+        'rows': results,
+    }
+
+
+@transaction.atomic
+def save_shard(run, result):
+    """Replace the shard's users' top matches and mark the shard done for ``run``."""
+    now = timezone.now()
+    TopMatch.objects.filter(user_id__in=result['viewer_ids']).delete()
+    TopMatch.objects.bulk_create(
+        (
+            TopMatch(
+                user_id=user_id, candidate_id=candidate_id, score=score, distance=distance,
+                rank=rank, profile_version=profile_version, computed_on=now,
+            )
+            for user_id, candidate_id, score, distance, rank, profile_version in result['rows']
+        ),
+        batch_size=1000,
+    )
+    TopMatchShard.objects.create(
+        run=run,
+        gender=result['gender'],
+        geo_cell=result['geo_cell'],
+        users=len(result['viewer_ids']),
+        pairs_scored=result['pairs'],
+    )
@@ -0,0 +1,18 @@
+# matches/signals.py
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import DiscoveryLog, Like
+from .feed import drop_from_feed
+
+
+@receiver(post_save, sender=Like)
+def drop_liked_from_feed(sender, instance, created, **kwargs):
+    if created:
+        drop_from_feed(instance.from_user_id, instance.to_user_id)
+
+
+@receiver(post_save, sender=DiscoveryLog)
+def drop_viewed_from_feed(sender, instance, created, **kwargs):
+    if created:
+        drop_from_feed(instance.viewer_id, instance.viewed_user_id)
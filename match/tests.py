@@ -1,3 +1,271 @@
-from django.test import TestCase
+from datetime import date
+import math
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.budget import Endpoint, EndpointBudgetTestCase
+from benchmarks.population import generate_population
+from blindspark.cursors import encode_cursor
+from users.models import Interest, User
+from .feed import (
+    MIN_SEEDED_FEED, _live_rows, build_feed, discovery_candidates, feed_page, get_feed,
+    opposite_gender, rescore_candidate,
+)
+from .models import DiscoveryFeedEntry, DiscoveryLog, Like, TopMatch
+from .utils import PairScoreCache, batch_match_scores, calculate_match_score, haversine_km
+
+
+class MatchEndpointBudgetTests(EndpointBudgetTestCase):
+    urlconf = 'match.urls'
+    endpoints = {
+        'discover': Endpoint(budget_ms=500),
+        'view_profile': Endpoint(args=lambda f: [f.stranger.id]),
+        'like_user': Endpoint(args=lambda f: [f.stranger.id], method='post', ajax=True),
+    }
+
+
+def feed_ids(user):
+    return set(DiscoveryFeedEntry.objects.filter(viewer=user).values_list('candidate_id', flat=True))
+
+
+class SeededFeedTests(TestCase):
+    def setUp(self):
+        population = generate_population(300, prefix='seed')
+        self.viewer = User.objects.get(id=population.user_ids[0])
+        self.live = _live_rows(self.viewer, discovery_candidates(self.viewer))
+        self.assertGreater(len(self.live), MIN_SEEDED_FEED + 2)
+
+    def seed(self, rows):
+        now = timezone.now()
+        TopMatch.objects.bulk_create(
+            TopMatch(user=self.viewer, candidate_id=candidate_id, score=score, distance=distance,
+                     rank=rank, profile_version=self.viewer.profile_version, computed_on=now)
+            for rank, (candidate_id, score, distance) in enumerate(rows, start=1)
+        )
+
+    def test_small_seed_falls_back_to_live_scores(self):
+        self.seed(self.live[:2])
+        build_feed(self.viewer)
+        self.assertEqual(feed_ids(self.viewer), {r[0] for r in self.live})
+
+    def test_seed_is_topped_up_with_newcomers_until_used_up(self):
+        top = self.live[:MIN_SEEDED_FEED + 2]
+        self.seed(top)
+        newcomer = User.objects.create_user(
+            'newcomer', password='x', gender=opposite_gender(self.viewer.gender), dob=date(1995, 1, 1),
+            latitude=self.viewer.latitude, longitude=self.viewer.longitude,
+        )
+        build_feed(self.viewer)
+        self.assertEqual(feed_ids(self.viewer), {r[0] for r in top} | {newcomer.id})
+
+        # Once the viewer has opened most of the seed, the feed is scored live again
+        DiscoveryLog.objects.bulk_create(
+            DiscoveryLog(viewer=self.viewer, viewed_user_id=candidate_id) for candidate_id, _, _ in top[:4]
+        )
+        build_feed(self.viewer)
+        self.assertEqual(
+            feed_ids(self.viewer),
+            {r[0] for r in self.live[4:]} | {newcomer.id},
+        )
+
+    def test_seed_rows_are_scored_live(self):
+        live = {candidate_id: (score, distance) for candidate_id, score, distance in self.live}
+        top = self.live[:MIN_SEEDED_FEED]
+        # As if the candidates had edited their profiles since the run
+        self.seed([(candidate_id, 99.0, 9999.0) for candidate_id, _, _ in top])
+        build_feed(self.viewer)
+        for entry in DiscoveryFeedEntry.objects.filter(viewer=self.viewer):
+            self.assertEqual((entry.score, entry.distance), live[entry.candidate_id])
+
+    def test_discover_continues_past_the_seed(self):
+        self.seed(self.live[:MIN_SEEDED_FEED])
+        self.client.force_login(self.viewer)
+        params, pages = {}, 0
+        while True:
+            data = self.client.get(
+                reverse('matches:discover'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            ).json()
+            pages += 1
+            if not data['has_next']:
+                break
+            params = {'cursor': data['cursor']}
+        self.assertEqual(pages, -(-len(self.live) // 9))
+        self.assertEqual(feed_ids(self.viewer), {r[0] for r in self.live})
+
+
+class FeedPagingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        population = generate_population(300, prefix='page')
+        cls.viewer = User.objects.get(id=population.user_ids[0])
+
+    def setUp(self):
+        self.order = [entry.candidate_id for entry in get_feed(self.viewer)]
+        self.assertGreater(len(self.order), 9)
+
+    def pages(self, size):
+        ids, cursor = [], None
+        while True:
+            entries, cursor = feed_page(get_feed(self.viewer), cursor, size)
+            ids += [entry.candidate_id for entry in entries]
+            if cursor is None:
+                return ids
+
+    def test_pages_cover_the_feed_once(self):
+        ids = self.pages(4)
+        self.assertEqual(ids, self.order)
+        entries, cursor = feed_page(get_feed(self.viewer), None, len(self.order))
+        self.assertEqual((len(entries), cursor), (len(self.order), None))
+
+    def test_drops_do_not_shift_later_pages(self):
+        first, cursor = feed_page(get_feed(self.viewer), None, 4)
+        # Viewed from the first page, liked from the second
+        DiscoveryLog.objects.create(viewer=self.viewer, viewed_user_id=first[0].candidate_id)
+        Like.objects.create(from_user=self.viewer, to_user_id=self.order[5])
+        self.assertFalse(
+            DiscoveryFeedEntry.objects.filter(
+                viewer=self.viewer, candidate_id__in=[first[0].candidate_id, self.order[5]],
+            ).exists()
+        )
+
+        second, _ = feed_page(get_feed(self.viewer), cursor, 4)
+        self.assertEqual([e.candidate_id for e in second], [i for i in self.order[4:9] if i != self.order[5]])
+
+    def test_discover_cursor(self):
+        self.client.force_login(self.viewer)
+        url = reverse('matches:discover')
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+        response = self.client.get(url, {'cursor': 'not a cursor'}, **ajax)
+        self.assertEqual(response.status_code, 400)
+        # A full page load shows the first page instead
+        response = self.client.get(url, {'cursor': 'not a cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [card['user'].id for card in response.context['page_obj']],
+            [entry.candidate_id for entry in feed_page(get_feed(self.viewer))[0]],
+        )
+
+        last = self.order[-2]
+        entry = DiscoveryFeedEntry.objects.get(viewer=self.viewer, candidate_id=last)
+        data = self.client.get(url, {'cursor': encode_cursor(entry.score, last)}, **ajax).json()
+        self.assertEqual((data['has_next'], data['cursor']), (False, None))
+
+
+class FeedMaintenanceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        population = generate_population(300, prefix='keep')
+        cls.viewer = User.objects.get(id=population.user_ids[0])
+
+    def test_likes_and_views_drop_feed_rows(self):
+        build_feed(self.viewer)
+        liked, viewed = [e.candidate_id for e in DiscoveryFeedEntry.objects.filter(viewer=self.viewer)[:2]]
+        Like.objects.create(from_user=self.viewer, to_user_id=liked)
+        DiscoveryLog.objects.create(viewer=self.viewer, viewed_user_id=viewed)
+        self.assertEqual(feed_ids(self.viewer) & {liked, viewed}, set())
+
+    def test_rescore_candidate_updates_and_drops_rows(self):
+        build_feed(self.viewer)
+        shown, hidden = list(DiscoveryFeedEntry.objects.filter(viewer=self.viewer)[:2])
+
+        candidate = shown.candidate
+        candidate.latitude, candidate.longitude = self.viewer.latitude, self.viewer.longitude
+        candidate.save()
+        hidden.candidate.gender = self.viewer.gender
+        hidden.candidate.save()
+        rescore_candidate(candidate)
+        rescore_candidate(hidden.candidate)
+
+        shown.refresh_from_db()
+        self.assertEqual(shown.distance, 0)
+        self.assertFalse(DiscoveryFeedEntry.objects.filter(id=hidden.id).exists())
+
+
+class BatchScoreTests(TestCase):
+    def setUp(self):
+        chess, yoga, golf = (Interest.objects.create(name=n) for n in ("Chess", "Yoga", "Golf"))
+        people = [
+            # (interests, location)
+            ([chess, yoga], (59.91, 10.75)),
+            ([chess], (59.95, 10.80)),
+            ([golf], (60.39, 5.32)),
+            ([], (59.90, 10.70)),
+            ([chess, yoga, golf], None),
+            ([], None),
+            ([yoga], (40.71, -74.0)),
+        ]
+        self.users = []
+        for i, (interests, location) in enumerate(people):
+            lat, lon = location or (None, None)
+            user = User.objects.create_user(f'batch{i}', password='x', latitude=lat, longitude=lon)
+            user.interests.set(interests)
+            self.users.append(User.objects.get(id=user.id))
+
+    def test_batch_matches_per_pair_scores(self):
+        by_id = {u.id: u for u in self.users}
+        for user in self.users:
+            ids, scores, distances = batch_match_scores(user, User.objects.filter(id__in=by_id).exclude(id=user.id))
+            self.assertEqual(len(ids), len(self.users) - 1)
+            for candidate_id, score, distance in zip(ids.tolist(), scores.tolist(), distances.tolist()):
+                other = by_id[candidate_id]
+                self.assertEqual(score, calculate_match_score(user, other), (user.username, other.username))
+                expected = haversine_km(user.latitude, user.longitude, other.latitude, other.longitude)
+                if expected is None:
+                    self.assertTrue(math.isnan(distance))
+                else:
+                    self.assertAlmostEqual(distance, expected, places=6)
+
+
+@mock.patch('match.utils.calculate_match_score', side_effect=lambda a, b: a.pk * 10 + b.pk)
+class PairScoreCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.users = [SimpleNamespace(pk=pk, profile_version=0) for pk in range(1, 5)]
+
+    def test_hits_misses_and_both_directions(self, score):
+        cache = PairScoreCache(max_size=10, ttl=60)
+        a, b = self.users[:2]
+        self.assertEqual(cache.get_score(a, b), 12)
+        self.assertEqual(cache.get_score(a, b), 12)
+        # Same entry, but the other side's score is computed separately
+        self.assertEqual(cache.get_score(b, a), 21)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 1})
+        self.assertEqual(score.call_count, 2)
+
+    def test_least_recently_used_pair_is_evicted(self, score):
+        cache = PairScoreCache(max_size=2, ttl=60)
+        a, b, c, d = self.users
+        cache.get_score(a, b)
+        cache.get_score(a, c)
+        cache.get_score(a, b)
+        cache.get_score(a, d)
+        self.assertEqual(cache.stats()['size'], 2)
+
+        score.reset_mock()
+        cache.get_score(a, b)
+        cache.get_score(a, c)
+        self.assertEqual(score.call_count, 1)
+
+    def test_entries_expire(self, score):
+        cache = PairScoreCache(max_size=10, ttl=60)
+        a, b = self.users[:2]
+        with mock.patch('match.utils.time.monotonic', return_value=1000):
+            cache.get_score(a, b)
+        with mock.patch('match.utils.time.monotonic', return_value=1059):
+            cache.get_score(a, b)
+        with mock.patch('match.utils.time.monotonic', return_value=1061):
+            cache.get_score(a, b)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'size': 1})
+
+    def test_profile_version_change_misses(self, score):
+        cache = PairScoreCache(max_size=10, ttl=60)
+        a, b = self.users[:2]
+        cache.get_score(a, b)
+        b.profile_version += 1
+        cache.get_score(a, b)
+        self.assertEqual(score.call_count, 2)
+        self.assertEqual(cache.stats()['misses'], 2)
@@ -1,5 +1,16 @@
 # matches/utils.py
+from collections import OrderedDict
 import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from users.utils import interest_count, shared_interest_count, pack_interest_masks, shared_interest_counts
+
+# loc_score (30 - km * 0.3) reaches zero at this distance
+DISCOVERY_RADIUS_KM = 100
 
 def haversine_km(lat1, lon1, lat2, lon2):
     if None in (lat1, lon1, lat2, lon2):
@@ -13,11 +24,20 @@ def haversine_km(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
     return R * c
 
+def haversine_km_array(lat1, lon1, lats, lons):
+    # Same formula as haversine_km, one origin against arrays of points
+    R = 6371.0
+    lat1_rad = np.radians(lat1)
+    lat2_rad = np.radians(lats)
+    dlat = np.radians(lats - lat1)
+    dlon = np.radians(lons - lon1)
+    a = np.sin(dlat/2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
+
 def calculate_match_score(user_a, user_b):
-    a_interests = set(user_a.interests.values_list('id', flat=True))
-    b_interests = set(user_b.interests.values_list('id', flat=True))
-    shared = len(a_interests & b_interests)
-    interest_score = (shared / max(len(a_interests), 1)) * 70
+    shared = shared_interest_count(user_a.interest_mask, user_b.interest_mask)
+    interest_score = (shared / max(interest_count(user_a.interest_mask), 1)) * 70
 
     loc_score = 15.0
     if all([user_a.latitude, user_a.longitude, user_b.latitude, user_b.longitude]):
@@ -25,4 +45,107 @@ def calculate_match_score(user_a, user_b):
         loc_score = max(0, 30 - dist * 0.3)
 
     total = interest_score + loc_score
-    return round(min(total, 100), 2)
\ No newline at end of file
+    return round(min(total, 100), 2)
+
+def batch_match_scores(user, candidates):
+    """
+    Score ``user`` against every user in the ``candidates`` queryset at once.
+
+    Loads id, location and interest mask in a single query and returns
+    ``(ids, scores, distances)`` as NumPy arrays. Scores are the same as
+    ``calculate_match_score(user, candidate)``; distances are NaN where
+    either side has no location.
+    """
+    ids, lats, lons, masks = load_score_arrays(candidates)
+    totals, distances = score_arrays(user, lats, lons, masks)
+    return ids, round_scores(totals), distances
+
+def load_score_arrays(candidates):
+    """``(ids, lats, lons, packed interest masks)`` for a queryset of users, in one query."""
+    rows = list(candidates.order_by().values_list('id', 'latitude', 'longitude', 'interest_mask'))
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lats = np.array([r[1] for r in rows], dtype=float)  # None -> nan
+    lons = np.array([r[2] for r in rows], dtype=float)
+    masks = pack_interest_masks([r[3] for r in rows])
+    return ids, lats, lons, masks
+
+def score_arrays(user, lats, lons, masks):
+    """Unrounded scores and distances of ``user`` against candidate arrays."""
+    # Interest score (0-70)
+    shared = shared_interest_counts(user.interest_mask, masks)
+    interest_score = (shared / max(interest_count(user.interest_mask), 1)) * 70
+
+    # Location score (0-30); zero coordinates count as missing, like calculate_match_score
+    distances = np.full(len(lats), np.nan)
+    loc_score = np.full(len(lats), 15.0)
+    if user.latitude and user.longitude:
+        located = np.nan_to_num(lats) != 0
+        located &= np.nan_to_num(lons) != 0
+        distances[located] = haversine_km_array(user.latitude, user.longitude, lats[located], lons[located])
+        loc_score[located] = np.maximum(0, 30 - distances[located] * 0.3)
+
+    return np.minimum(interest_score + loc_score, 100), distances
+
+def round_scores(totals):
+    # Python's round() so results match calculate_match_score exactly
+    return np.array([round(s, 2) for s in totals.tolist()], dtype=float)
+
+class PairScoreCache:
+    """
+    Bounded LRU cache of compatibility scores with a per-entry TTL.
+
+    Entries are keyed by the unordered user pair plus both users'
+    ``profile_version``, so any profile or interest edit makes old entries
+    unreachable. Each entry holds the score from both sides, since
+    ``calculate_match_score`` is not symmetric.
+    """
+
+    def __init__(self, max_size=10000, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_a, user_b):
+        low, high = sorted([user_a, user_b], key=lambda u: u.pk)
+        return (low.pk, low.profile_version, high.pk, high.profile_version)
+
+    def get_score(self, user_a, user_b):
+        """Score of ``user_b`` for ``user_a``, computed on a miss."""
+        key = self._key(user_a, user_b)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and user_a.pk in entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1][user_a.pk]
+            self.misses += 1
+
+        score = calculate_match_score(user_a, user_b)
+        with self._lock:
+            entry = self._entries.get(key)
+            scores = entry[1] if entry is not None and entry[0] > now else {}
+            scores[user_a.pk] = score
+            self._entries[key] = (now + self.ttl, scores)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return score
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+pair_score_cache = PairScoreCache(settings.PAIR_SCORE_CACHE_SIZE, settings.PAIR_SCORE_CACHE_TTL)
+
+def cached_match_score(user_a, user_b):
+    return pair_score_cache.get_score(user_a, user_b)
@@ -7,11 +7,12 @@ from django.urls import reverse
 from django.http import JsonResponse, Http404
 from django.core.paginator import Paginator
 from django.utils import timezone
-from datetime import date
-
+from blindspark.cursors import decode_cursor, encode_cursor
+from users.catalog import get_catalog
 from users.models import User
 from .models import Match, DiscoveryLog, Like
-from .utils import calculate_match_score, haversine_km
+from .utils import cached_match_score
+from .feed import extend_feed, get_feed, feed_page
 from chat.models import ChatRoom
 
 
@@ -21,69 +22,55 @@ def discover_matches(request):
     user = request.user
 
     # Require 80% profile completion
-    if user.profile_completion() < 80:
+    if user.profile_completion < 80:
         messages.warning(request, "Complete 80% of your profile to access discovery.")
         return redirect('users:edit')
 
-    # Only users 18+
-    eighteen_years_ago = date.today().replace(year=date.today().year - 18)
-    potential = User.objects.exclude(id=user.id).filter(
-        dob__isnull=False,
-        dob__lte=eighteen_years_ago,
-    )
-
-    # Filter by opposite gender if set
-    if user.gender in ('M', 'F'):
-        potential = potential.filter(gender=('F' if user.gender == 'M' else 'M'))
-
-    # Exclude users already viewed
-    viewed_ids = DiscoveryLog.objects.filter(viewer=user).values_list('viewed_user_id', flat=True)
-    potential = potential.exclude(id__in=viewed_ids).prefetch_related('interests')
-
-    # Stable ordering by id for consistent pagination
-    potential = potential.order_by('id')
-
-    # Precompute user interests & location
-    user_interests = set(user.interests.values_list('id', flat=True))
-    user_lat, user_lon = user.latitude, user.longitude
-
-    results = []
-    for p in potential:
-        # Interest score (0-70)
-        shared = len(user_interests & set(p.interests.values_list('id', flat=True)))
-        interest_score = (shared / max(len(user_interests), 1)) * 70
-
-        # Location score (0-30)
-        distance = None
-        loc_score = 15.0
-        if user_lat and user_lon and p.latitude and p.longitude:
-            distance = round(haversine_km(user_lat, user_lon, p.latitude, p.longitude), 1)
-            loc_score = max(0, 30 - distance * 0.3)
-            print(f"Distance to {p.username}: {distance} km, loc_score: {loc_score}")
-
-        total_score = interest_score + loc_score
-        if total_score >= 10:  # only include relevant matches
-            results.append({
-                'user': p,
-                'score': round(total_score, 2),
-                'distance': distance
-            })
-
-    # Sort by score DESC, then id ASC to avoid duplicates across pages
-    results.sort(key=lambda x: (-x['score'], x['user'].id))
-
-
-    # Pagination
-    paginator = Paginator(results, 9)  # 9 per page
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
+    # Ranked feed, materialized per viewer and kept current by match/signals.py
+    feed = get_feed(user).select_related('candidate')
+    ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+
+    # Legacy page-number pagination
+    if 'page' in request.GET:
+        paginator = Paginator(feed, 9)  # 9 per page
+        page_obj = paginator.get_page(request.GET['page'])
+        if not page_obj.has_next() and extend_feed(user):
+            paginator = Paginator(feed, 9)
+            page_obj = paginator.get_page(request.GET['page'])
+        entries, has_next = list(page_obj.object_list), page_obj.has_next()
+        next_cursor = encode_cursor(entries[-1].score, entries[-1].candidate_id) if has_next else None
+    # Cursor pagination: constant cost per page, no duplicates while the feed changes
+    else:
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                if ajax:
+                    return JsonResponse({'error': 'Invalid cursor'}, status=400)
+                # A stale or edited link: show the first page
+                cursor = None
+        entries, next_cursor = feed_page(feed, cursor, 9)
+        # A seeded feed continues with the candidates it left out
+        if next_cursor is None and extend_feed(user):
+            entries, next_cursor = feed_page(feed, cursor, 9)
+        has_next = next_cursor is not None
+
+    cards = [
+        {'user': entry.candidate, 'score': entry.score, 'distance': entry.distance}
+        for entry in entries
+    ]
 
     # AJAX infinite scroll
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        cards_html = render(request, 'matches/_cards.html', {'page_obj': page_obj}).content.decode()
-        return JsonResponse({'html': cards_html, 'has_next': page_obj.has_next()})
-
-    return render(request, 'matches/discover.html', {'page_obj': page_obj,'has_next': page_obj.has_next()})
+    if ajax:
+        cards_html = render(request, 'matches/_cards.html', {'page_obj': cards}).content.decode()
+        return JsonResponse({'html': cards_html, 'has_next': has_next, 'cursor': next_cursor})
+
+    return render(request, 'matches/discover.html', {
+        'page_obj': cards,
+        'has_next': has_next,
+        'next_cursor': next_cursor,
+    })
 
 
 @login_required
@@ -100,7 +87,7 @@ def view_profile(request, user_id):
     # LOG ONLY WHEN USER ACTUALLY OPENS PROFILE
     DiscoveryLog.objects.get_or_create(viewer=request.user, viewed_user=target)
 
-    score = calculate_match_score(request.user, target)
+    score = cached_match_score(request.user, target)
     a, b = sorted([request.user.id, target.id])
     match = Match.objects.filter(user_a_id=a, user_b_id=b).first()
 
@@ -109,6 +96,7 @@ def view_profile(request, user_id):
 
     return render(request, 'matches/view_profile.html', {
         'target': target,
+        'interests': get_catalog().names_for_mask(target.interest_mask),
         'score': score,
         'match': match,
         'is_liked_by_me': is_liked_by_me,
@@ -139,7 +127,7 @@ def like_user(request, user_id):
             a_id, b_id = sorted([request.user.id, target.id])
             match_obj, _ = Match.objects.get_or_create(
                 user_a_id=a_id, user_b_id=b_id,
-                defaults={'compatibility_score': calculate_match_score(request.user, target)}
+                defaults={'compatibility_score': cached_match_score(request.user, target)}
             )
             match_obj.is_active = True
             match_obj.save()
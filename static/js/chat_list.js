@@ -6,32 +6,39 @@ window.addEventListener("pageshow", function (event) {
     }
 });
 
-// --- Auto-refresh chat list every 5 seconds ---
+// --- Refresh changed conversations every 5 seconds ---
 setInterval(() => {
-    fetch(window.location.href, {
-        headers: { "X-Requested-With": "XMLHttpRequest" }
-    })
-    .then(res => res.text())
-    .then(html => {
-        const parser = new DOMParser();
-        const doc = parser.parseFromString(html, "text/html");
-
-        const newList = doc.querySelector(".list-group");
-        const oldList = document.querySelector(".list-group");
+    fetch(`${CHAT_LIST_CHANGES_URL}?since=${encodeURIComponent(chatListSince)}`)
+    .then(res => res.json())
+    .then(data => {
+        chatListSince = data.since;
+        if (!data.items.length) return;
 
-        if (newList && oldList) {
-            oldList.innerHTML = newList.innerHTML;
+        const list = document.querySelector(".list-group");
+        if (!list) {
+            // First conversation; the empty state has no list to update
+            window.location.reload();
+            return;
         }
+
+        // Items come newest first; insert oldest first so the newest ends on top
+        data.items.slice().reverse().forEach(item => {
+            list.querySelector(`.chat-item[data-room-id="${item.id}"]`)?.remove();
+            list.insertAdjacentHTML("afterbegin", item.html);
+        });
+        filterChats();
     })
     .catch(err => console.error("Chat list refresh failed:", err));
 }, 5000);
 
 // --- FIXED SEARCH FILTER ---
-document.getElementById('search-input').addEventListener('input', function() {
-    const query = this.value.toLowerCase();
+function filterChats() {
+    const query = document.getElementById('search-input').value.toLowerCase();
 
     document.querySelectorAll('.chat-item').forEach(item => {
         const username = item.dataset.name;
         item.style.display = username.includes(query) ? '' : 'none';
     });
-});
+}
+
+document.getElementById('search-input').addEventListener('input', filterChats);
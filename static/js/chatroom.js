@@ -5,7 +5,16 @@ const popup = document.getElementById('delete-popup');
 
 let currentMsgId = null;
 let pressTimer;
-let lastMessageCount = 0;
+let lastId = null;    // highest message id rendered
+let firstId = null;   // lowest message id rendered
+let hasMore = false;  // older history exists above firstId
+let loadingOlder = false;
+let version = 0;      // room version the rendered messages reflect
+let polling = false;  // a fetch is in flight
+let refetch = false;  // another fetch was asked for while one was in flight
+let longPolling = false;
+let waiting = false;  // a long-poll request is parked
+let reconnectDelay = 1000;
 
 // Scroll to bottom
 function scrollToBottom() {
@@ -20,22 +29,228 @@ function scrollToBottomIfNearBottom() {
   if (isNearBottom) scrollToBottom();
 }
 
-// Fetch messages
-function fetchMessages() {
-  fetch(CHAT_FETCH_URL)
+// Full render, used once on load
+function loadMessages() {
+  return fetch(CHAT_FETCH_URL)
     .then(res => res.json())
     .then(data => {
-      const oldMessageCount = lastMessageCount;
-
       chatBox.innerHTML = data.html;
       attachDeleteListeners();
-      lastMessageCount = data.messages_count;
+      lastId = data.last_id;
+      firstId = data.first_id;
+      hasMore = data.has_more;
+      version = data.version;
+      scrollToBottom();
+    });
+}
+
+// Older history, one page at a time, when scrolled to the top
+function loadOlder() {
+  if (loadingOlder || !hasMore) return;
+  loadingOlder = true;
+
+  fetch(`${CHAT_FETCH_URL}?before_id=${firstId}`)
+    .then(res => res.json())
+    .then(data => {
+      const page = document.createElement("template");
+      page.innerHTML = data.html;
+      const older = page.content.querySelector(".chat-messages");
+      const list = chatBox.querySelector(".chat-messages");
+
+      // The page ends on the day the current window starts with; keep one separator
+      const pageSeparators = older.querySelectorAll(".date-separator");
+      const lastOlderDate = pageSeparators.length ? pageSeparators[pageSeparators.length - 1].dataset.date : null;
+      const firstSeparator = list.querySelector(".date-separator");
+      if (firstSeparator && firstSeparator === list.firstElementChild && firstSeparator.dataset.date === lastOlderDate) {
+        firstSeparator.remove();
+      }
+
+      const heightBefore = chatBox.scrollHeight;
+      list.prepend(...older.childNodes);
+      chatBox.scrollTop += chatBox.scrollHeight - heightBefore;
+
+      if (data.first_id !== null) firstId = data.first_id;
+      hasMore = data.has_more;
+      attachDeleteListeners();
+    })
+    .finally(() => { loadingOlder = false; });
+}
+
+chatBox.addEventListener("scroll", () => {
+  if (chatBox.scrollTop < 50) loadOlder();
+});
+
+function lastRenderedDate() {
+  const separators = chatBox.querySelectorAll(".date-separator");
+  return separators.length ? separators[separators.length - 1].dataset.date : null;
+}
+
+function renderMessage(m) {
+  const list = chatBox.querySelector(".chat-messages");
+
+  if (m.date !== lastRenderedDate()) {
+    const separator = document.createElement("div");
+    separator.className = "date-separator";
+    separator.dataset.date = m.date;
+    const label = document.createElement("span");
+    label.textContent = m.day;
+    separator.appendChild(label);
+    list.appendChild(separator);
+  }
+
+  const row = document.createElement("div");
+  row.className = "msg-row " + (m.mine ? "right" : "left");
+  row.dataset.id = m.id;
+  row.appendChild(m.deleted ? deletedBubble() : messageBubble(m));
+  list.appendChild(row);
+}
+
+function messageBubble(m) {
+  const bubble = document.createElement("div");
+  bubble.className = "msg-bubble " + (m.mine ? "me" : "them");
+  if (m.mine) bubble.dataset.msgId = m.id;
+  bubble.appendChild(document.createTextNode(m.text));
+  const time = document.createElement("div");
+  time.className = "msg-time";
+  time.textContent = m.time;
+  bubble.appendChild(time);
+  return bubble;
+}
+
+function deletedBubble() {
+  const bubble = document.createElement("div");
+  bubble.className = "msg-bubble deleted";
+  const note = document.createElement("em");
+  note.textContent = "This message was deleted";
+  bubble.appendChild(note);
+  return bubble;
+}
+
+function applyChange(change) {
+  const row = chatBox.querySelector(`.msg-row[data-id="${change.id}"]`);
+  if (row && change.deleted && !row.querySelector(".msg-bubble.deleted")) {
+    row.replaceChildren(deletedBubble());
+  }
+}
+
+function applyDelta(data) {
+  data.changes.forEach(applyChange);
+  // A push or another request may have rendered some of these already
+  data.messages.filter(m => m.id > lastId).forEach(m => {
+    renderMessage(m);
+    lastId = m.id;
+  });
+  version = Math.max(version, data.version);
+
+  if (data.messages.length) {
+    attachDeleteListeners();
+    scrollToBottom();
+  }
+}
+
+// Fetch messages and changes since the last known id and version
+function fetchMessages() {
+  if (lastId === null) return;
+  if (polling) {
+    refetch = true;
+    return;
+  }
+  polling = true;
+
+  fetch(`${CHAT_FETCH_URL}?after_id=${lastId}&since=${version}`)
+    .then(res => res.json())
+    .then(applyDelta)
+    .finally(() => {
+      polling = false;
+      if (refetch) {
+        refetch = false;
+        fetchMessages();
+      }
+    });
+}
+
+// Long-poll while the socket is down; the server parks each request until the room changes
+function startPolling() {
+  if (longPolling) return;
+  longPolling = true;
+  longPoll();
+}
 
-      if (oldMessageCount === 0) scrollToBottom();
-      else if (lastMessageCount > oldMessageCount) scrollToBottom();
+function stopPolling() {
+  longPolling = false;
+}
+
+function longPoll() {
+  if (!longPolling || waiting) return;
+  waiting = true;
+  fetch(`${CHAT_WAIT_URL}?after_id=${lastId}&since=${version}`)
+    .then(res => {
+      if (!res.ok) throw new Error(res.status);
+      return res.json();
+    })
+    .then(data => {
+      applyDelta(data);
+      return 0;
+    })
+    .catch(() => 2000)  // back off on errors
+    .then(delay => {
+      waiting = false;
+      setTimeout(longPoll, delay);
     });
 }
 
+// Pushed events; long-polling only runs while the socket is down
+function handleEvent(event) {
+  switch (event.type) {
+    case "message":
+      if (!event.mine) {
+        // Fetch it, so the server marks it read
+        fetchMessages();
+      } else if (event.message.id > lastId) {
+        renderMessage(event.message);
+        lastId = event.message.id;
+        if (event.version === version + 1) version = event.version;
+        attachDeleteListeners();
+        scrollToBottom();
+      }
+      break;
+    case "delete":
+      applyChange({ id: event.id, deleted: true });
+      if (event.version === version + 1) version = event.version;
+      break;
+    case "reveal_requested":
+      if (!event.mine) {
+        document.getElementById("reveal-controls").innerHTML =
+          '<button id="accept-btn" class="btn btn-success btn-sm">Accept</button>';
+      }
+      break;
+    case "reveal_accepted":
+      showUnblurred(event.photos[OTHER_USER_ID]);
+      break;
+    case "resync":
+      fetchMessages();
+      break;
+  }
+}
+
+function connectSocket() {
+  if (!("WebSocket" in window)) return;
+  const scheme = location.protocol === "https:" ? "wss" : "ws";
+  const socket = new WebSocket(`${scheme}://${location.host}${CHAT_SOCKET_PATH}`);
+
+  socket.onopen = () => {
+    reconnectDelay = 1000;
+    stopPolling();
+    fetchMessages();  // catch up on anything missed while disconnected
+  };
+  socket.onmessage = (e) => handleEvent(JSON.parse(e.data));
+  socket.onclose = () => {
+    startPolling();
+    setTimeout(connectSocket, reconnectDelay);
+    reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+  };
+}
+
 // Delete message
 function deleteMessage() {
   if (!currentMsgId || !confirm("Delete this message?")) return;
@@ -108,36 +323,50 @@ form.addEventListener("submit", (e) => {
   });
 });
 
-// Reveal buttons
-document.getElementById("request-btn")?.addEventListener("click", () => {
-  fetch(REQUEST_REVEAL_URL, {
-    method: "POST",
-    headers: { "X-CSRFToken": CSRF_TOKEN }
-  })
-    .then(r => r.json())
-    .then(d => {
-      if (d.requested) {
-        document.getElementById("reveal-controls").innerHTML =
-          '<button class="btn btn-warning btn-sm" disabled>Requested</button>';
-      }
-    });
-});
+// Reveal buttons (delegated, since pushes replace them)
+function showUnblurred(photo) {
+  const img = document.getElementById("profile-photo");
+  // The page only had the server-blurred copy; swap in the clear one
+  if (photo) {
+    const source = img.closest("picture")?.querySelector("source");
+    if (source) {
+      if (photo.webp) source.srcset = photo.webp;
+      else source.remove();
+    }
+    img.src = photo.src;
+  }
+  img.classList.remove("blur-photo");
+  document.getElementById("reveal-controls").innerHTML =
+    '<span class="text-success small">Unblurred</span>';
+}
 
-document.getElementById("accept-btn")?.addEventListener("click", () => {
-  fetch(ACCEPT_REVEAL_URL, {
-    method: "POST",
-    headers: { "X-CSRFToken": CSRF_TOKEN }
-  })
-    .then(r => r.json())
-    .then(d => {
-      if (d.accepted) {
-        document.getElementById("profile-photo").classList.remove("blur-photo");
-        document.getElementById("reveal-controls").innerHTML =
-          '<span class="text-success small">Unblurred</span>';
-      }
-    });
+document.getElementById("reveal-controls").addEventListener("click", (e) => {
+  if (e.target.id === "request-btn") {
+    fetch(REQUEST_REVEAL_URL, {
+      method: "POST",
+      headers: { "X-CSRFToken": CSRF_TOKEN }
+    })
+      .then(r => r.json())
+      .then(d => {
+        if (d.requested) {
+          document.getElementById("reveal-controls").innerHTML =
+            '<button class="btn btn-warning btn-sm" disabled>Requested</button>';
+        }
+      });
+  } else if (e.target.id === "accept-btn") {
+    fetch(ACCEPT_REVEAL_URL, {
+      method: "POST",
+      headers: { "X-CSRFToken": CSRF_TOKEN }
+    })
+      .then(r => r.json())
+      .then(d => {
+        if (d.accepted) showUnblurred(d.photo);
+      });
+  }
 });
 
 // Init
-fetchMessages();
-setInterval(fetchMessages, 2000);
+loadMessages().then(() => {
+  startPolling();
+  connectSocket();
+});
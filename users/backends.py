@@ -0,0 +1,64 @@
+# users/backends.py
+"""
+Authentication backend that serves request.user from the cache.
+
+AuthenticationMiddleware loads the session's user on every request,
+including the chat polling endpoints. CachedModelBackend keeps each user
+row, with its interests prefetched, in the 'users' cache. The cache is
+per process, so every hit is checked against the row's STAMP_FIELDS in
+one single-row query: a deactivation, password change or profile edit
+saved by another worker reloads the entry on the next request. Entries
+are also dropped on save in the saving process and otherwise expire
+after USER_CACHE_TTL.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+
+from .models import User
+
+
+# Compared on every hit; auth state plus the version bumped by profile edits
+STAMP_FIELDS = ('is_active', 'password', 'profile_version')
+
+
+def _cache():
+    return caches['users']
+
+
+def _cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def get_cached_user(user_id):
+    """The User with ``user_id`` and its interests, or None; one single-row query on a hit."""
+    key = _cache_key(user_id)
+    user = _cache().get(key)
+    if user is not None:
+        stamp = User.objects.filter(pk=user_id).values_list(*STAMP_FIELDS, 'last_seen').first()
+        if stamp is None:
+            invalidate_user(user_id)
+            return None
+        if stamp[:-1] == tuple(getattr(user, name) for name in STAMP_FIELDS):
+            # Heartbeat flushes don't invalidate entries; see users/presence.py
+            user.last_seen = stamp[-1]
+            return user
+    user = User.objects.prefetch_related('interests').filter(pk=user_id).first()
+    if user is not None:
+        _cache().set(key, user, settings.USER_CACHE_TTL)
+    return user
+
+
+def invalidate_user(*user_ids):
+    _cache().delete_many([_cache_key(user_id) for user_id in user_ids])
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        try:
+            user_id = User._meta.pk.to_python(user_id)
+        except ValidationError:
+            return None
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,79 @@
+# users/catalog.py
+"""
+Process-local copy of the Interest table.
+
+Interests change rarely but are read on every profile edit and view. Each
+process keeps one InterestCatalog and reloads it when the version stamp in
+the default cache changes (saving or deleting an Interest bumps it, see
+users/signals.py) or when it is older than INTEREST_CATALOG_TTL. With a
+per-process cache the stamp only covers changes made in the same process;
+the TTL bounds how stale other processes get, and the profile form reloads
+early when it is sent an id it doesn't know. The JSON the edit page embeds
+is built once per load.
+"""
+from dataclasses import dataclass
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Interest
+from .utils import interest_ids_from_mask
+
+VERSION_KEY = 'interests:catalog_version'
+
+_lock = threading.Lock()
+_catalog = None
+
+
+@dataclass(frozen=True)
+class InterestCatalog:
+    version: str
+    # id -> name, in name order
+    names: dict
+    # [[id, name], ...] for users/edit_profile.html
+    json: str
+    loaded_at: float
+
+    @property
+    def choices(self):
+        return list(self.names.items())
+
+    def names_for_mask(self, mask):
+        """Names of the interests set in an interest mask, in name order."""
+        ids = set(interest_ids_from_mask(mask))
+        return [name for interest_id, name in self.names.items() if interest_id in ids]
+
+
+def _current_version():
+    # A fresh token when the cache has none, so every process reloads
+    cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+    return cache.get(VERSION_KEY)
+
+
+def _expired(catalog):
+    return time.monotonic() - catalog.loaded_at >= settings.INTEREST_CATALOG_TTL
+
+
+def get_catalog(refresh=False):
+    """The current InterestCatalog; queries only after a version bump, on expiry or on ``refresh``."""
+    global _catalog
+    version = _current_version()
+    catalog = _catalog
+    if refresh or catalog is None or catalog.version != version or _expired(catalog):
+        with _lock:
+            names = dict(Interest.objects.order_by('name').values_list('id', 'name'))
+            catalog = _catalog = InterestCatalog(
+                version=version,
+                names=names,
+                json=json.dumps(list(names.items())),
+                loaded_at=time.monotonic(),
+            )
+    return catalog
+
+
+def bump_catalog_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
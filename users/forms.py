@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from .models import User,Interest
+from .catalog import get_catalog
+from .models import User
+from .photos import schedule_photo_variants
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout, Field, Submit, Row, Column
 from django.utils import timezone
@@ -11,7 +13,17 @@ def get_max_dob():
     return date(today.year - 18, today.month, today.day)
 
 
-class UserRegisterForm(UserCreationForm):
+class PhotoVariantsMixin:
+    """Queue resized and blurred copies of a newly uploaded profile photo."""
+
+    def save(self, commit=True):
+        user = super().save(commit)
+        if commit and 'profile_photo' in self.changed_data and user.profile_photo:
+            schedule_photo_variants(user.pk)
+        return user
+
+
+class UserRegisterForm(PhotoVariantsMixin, UserCreationForm):
     dob = forms.DateField(
         widget=forms.DateInput(attrs={'type': 'date'}),
         help_text="You must be 18+"
@@ -36,9 +48,10 @@ class UserRegisterForm(UserCreationForm):
         return dob
 
 
-class UserProfileForm(forms.ModelForm):
-    interests = forms.ModelMultipleChoiceField(
-        queryset=Interest.objects.all(),
+class UserProfileForm(PhotoVariantsMixin, forms.ModelForm):
+    # Choices come from the interest catalog, so validating them needs no query
+    interests = forms.TypedMultipleChoiceField(
+        coerce=int,
         widget=forms.CheckboxSelectMultiple,
         required=False
     )
@@ -63,6 +76,15 @@ class UserProfileForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # DYNAMIC max date: 18 years ago from TODAY
         self.fields['dob'].widget.attrs['max'] = get_max_dob().isoformat()
+        catalog = get_catalog()
+        if self.is_bound:
+            submitted = self.fields['interests'].widget.value_from_datadict(
+                self.data, self.files, self.add_prefix('interests'),
+            )
+            if not {str(i) for i in catalog.names} >= set(submitted):
+                # Possibly added in another process since this one loaded
+                catalog = get_catalog(refresh=True)
+        self.fields['interests'].choices = catalog.choices
 
         self.helper = FormHelper()
         self.helper.form_method = 'post'
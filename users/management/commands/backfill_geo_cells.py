@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User
+from users.utils import geo_cell
+
+
+class Command(BaseCommand):
+    help = "Fill in User.geo_cell for rows saved before the geo cell index existed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = User.objects.only('id', 'latitude', 'longitude', 'geo_cell').order_by('id')
+
+        batch, updated = [], 0
+        for user in users.iterator(chunk_size=batch_size):
+            cell = geo_cell(user.latitude, user.longitude)
+            if cell != user.geo_cell:
+                user.geo_cell = cell
+                batch.append(user)
+            if len(batch) >= batch_size:
+                User.objects.bulk_update(batch, ['geo_cell'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            User.objects.bulk_update(batch, ['geo_cell'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated geo cells for {updated} users."))
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from users.models import User
+from users.photos import generate_photo_variants
+
+
+class Command(BaseCommand):
+    help = "Render resized and blurred copies of profile photos that don't have current ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.PHOTO_VARIANT_WORKERS or 1,
+                            help="Threads rendering photos; 0 renders in this thread.")
+        parser.add_argument('--force', action='store_true', help="Re-render photos that already have variants.")
+
+    def handle(self, *args, **options):
+        users = User.objects.exclude(profile_photo='').only('id', 'profile_photo', 'photo_variants')
+        todo = [
+            user.id for user in users.iterator()
+            if options['force'] or user.photo_variants.get('source') != user.profile_photo.name
+        ]
+        self.stdout.write(f"{len(todo)} photos to render.")
+
+        done = failed = 0
+        for user_id, error in self._results(todo, options['workers']):
+            if error:
+                failed += 1
+                self.stderr.write(f"User {user_id}: {error}")
+            else:
+                done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rendered variants for {done} photos, {failed} failed."))
+
+    def _results(self, user_ids, workers):
+        if not workers:
+            for user_id in user_ids:
+                yield user_id, self._render(user_id)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from zip(user_ids, pool.map(self._render_in_thread, user_ids))
+
+    def _render(self, user_id):
+        try:
+            generate_photo_variants(user_id)
+        except (OSError, ValueError) as exc:
+            return exc
+        return None
+
+    def _render_in_thread(self, user_id):
+        try:
+            return self._render(user_id)
+        finally:
+            connections.close_all()
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Recompute User.profile_completion where it has drifted, e.g. after bulk writes that skip signals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = User.objects.only(
+            'id', 'dob', 'gender', 'bio', 'profile_photo', 'city', 'interest_mask', 'profile_completion',
+        ).order_by('id')
+
+        batch, updated = [], 0
+        for user in users.iterator(chunk_size=batch_size):
+            completion = user.compute_profile_completion()
+            if completion != user.profile_completion:
+                user.profile_completion = completion
+                batch.append(user)
+            if len(batch) >= batch_size:
+                User.objects.bulk_update(batch, ['profile_completion'])
+                updated += len(batch)
+                batch = []
+        if batch:
+            User.objects.bulk_update(batch, ['profile_completion'])
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated profile completion for {updated} users."))
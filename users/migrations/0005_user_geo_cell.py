@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_last_seen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='geo_cell',
+            field=models.IntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:02
+
+from django.db import migrations, models
+
+
+MASK_BITS = 32 * 8
+
+
+def fill_interest_masks(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    masks = {}
+    skipped = set()
+    for user_id, interest_id in User.interests.through.objects.values_list('user_id', 'interest_id'):
+        if not 1 <= interest_id <= MASK_BITS:
+            skipped.add(interest_id)
+            continue
+        masks[user_id] = masks.get(user_id, 0) | 1 << (interest_id - 1)
+    # Same check as Interest.save(); these interests are left out of the masks
+    for interest_id in sorted(skipped):
+        print(f"Interest id {interest_id} does not fit in User.interest_mask; skipped.")
+    users = [User(id=user_id, interest_mask=bits.to_bytes(32, 'little')) for user_id, bits in masks.items()]
+    User.objects.bulk_update(users, ['interest_mask'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_geo_cell'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='interest_mask',
+            field=models.BinaryField(default=b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00', max_length=32),
+        ),
+        migrations.RunPython(fill_interest_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:32
+
+from datetime import date
+
+from django.db import migrations, models
+
+
+def _completion(user, today):
+    # Frozen copy of User.compute_profile_completion() as of this migration
+    age = None
+    if user.dob:
+        age = today.year - user.dob.year - ((today.month, today.day) < (user.dob.month, user.dob.day))
+    has_interests = any(bytes(user.interest_mask))
+    filled = sum(1 for v in (age, user.gender, user.bio, user.profile_photo, user.city, has_interests) if v)
+    percent = filled / 6 * 100 + (10 if has_interests else 0)
+    return min(round(percent), 100)
+
+
+def fill_profile_completion(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    today = date.today()
+    users = User.objects.only('id', 'dob', 'gender', 'bio', 'profile_photo', 'city', 'interest_mask')
+    batch = []
+    for user in users.iterator(chunk_size=1000):
+        user.profile_completion = _completion(user, today)
+        batch.append(user)
+    User.objects.bulk_update(batch, ['profile_completion'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_user_profile_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='profile_completion',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_profile_completion, migrations.RunPython.noop),
+    ]
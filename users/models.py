@@ -1,8 +1,10 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Max
 from datetime import date
-from datetime import timedelta
+
+from .utils import INTEREST_MASK_BITS, INTEREST_MASK_BYTES, EMPTY_INTEREST_MASK
 
 class Interest(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -11,6 +13,18 @@ class Interest(models.Model):
         ordering = ['name']
     def __str__(self): return self.name
 
+    def clean(self):
+        super().clean()
+        if self.pk is None and (Interest.objects.aggregate(Max('id'))['id__max'] or 0) >= INTEREST_MASK_BITS:
+            raise ValidationError(f"No more than {INTEREST_MASK_BITS} interests fit in User.interest_mask.")
+
+    def save(self, *args, **kwargs):
+        # Ids are bit positions in User.interest_mask; refuse any past the last bit
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.id > INTEREST_MASK_BITS:
+                raise ValidationError(f"Interest id {self.id} does not fit in User.interest_mask.")
+
 
 class User(AbstractUser):
     dob = models.DateField("Date of Birth", null=True, blank=True)    
@@ -25,11 +39,64 @@ class User(AbstractUser):
     profile_photo = models.ImageField(upload_to='profile_photos/', blank=True)
     is_verified = models.BooleanField(default=False)
     last_seen = models.DateTimeField(null=True, blank=True)
+    geo_cell = models.IntegerField(null=True, blank=True, db_index=True, editable=False)
+    # Denormalized copy of `interests`, rebuilt by m2m_changed (see users/signals.py)
+    interest_mask = models.BinaryField(max_length=INTEREST_MASK_BYTES, default=EMPTY_INTEREST_MASK, editable=False)
+    # Goes up whenever score-relevant profile data changes; used to invalidate caches
+    profile_version = models.PositiveIntegerField(default=0, editable=False)
+    # Stored compute_profile_completion(), kept current by users/signals.py
+    profile_completion = models.PositiveSmallIntegerField(default=0, editable=False)
+    # Resized and blurred copies of profile_photo (see users/photos.py)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Columns derived from other fields in pre_save (see users/signals.py)
+    DERIVED_FIELDS = {
+        'geo_cell': {'latitude', 'longitude'},
+        'profile_completion': {'dob', 'gender', 'bio', 'profile_photo', 'city', 'interest_mask'},
+    }
 
     def __str__(self):
         return self.username
+
+    def save(self, *args, **kwargs):
+        # Partial saves of a source field must also write the column derived from it
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            for derived, sources in self.DERIVED_FIELDS.items():
+                if update_fields & sources:
+                    update_fields.add(derived)
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
     
 
+    def bump_profile_version(self):
+        from .backends import invalidate_user
+        User.objects.filter(pk=self.pk).update(profile_version=models.F('profile_version') + 1)
+        invalidate_user(self.pk)
+        self.refresh_from_db(fields=['profile_version'])
+
+    def set_interests(self, interest_ids):
+        """
+        Replace the user's interests; True if they changed.
+
+        interests.set() removes then adds, so the m2m_changed receiver
+        would rebuild interest_mask and bump profile_version twice. This
+        sends one signal at most.
+        """
+        new = set(interest_ids)
+        old = set(self.interests.values_list('id', flat=True))
+        removed, added = old - new, new - old
+        with transaction.atomic():
+            if removed and added:
+                # No signal; the add's rebuild reads the whole M2M table
+                self.interests.through.objects.filter(user=self, interest_id__in=removed).delete()
+            elif removed:
+                self.interests.remove(*removed)
+            if added:
+                self.interests.add(*added)
+        return bool(removed or added)
+
     @property
     def age(self):
         if not self.dob:
@@ -43,22 +110,26 @@ class User(AbstractUser):
     def is_adult(self):
         return self.age is not None and self.age >= 18
     
+    @property
+    def has_interests(self):
+        return any(bytes(self.interest_mask))
+
     @property
     def is_online(self):
-        if not self.last_seen:
-            return False
-        return timezone.now() - self.last_seen < timedelta(minutes=2)
+        # Heartbeats reach the row late; see users/presence.py
+        from .presence import is_online
+        return is_online(self)
     
 
      # 🔹 Profile completion percentage
-    def profile_completion(self):
+    def compute_profile_completion(self):
         fields = {
             'age': self.age,
             'gender': self.gender,
             'bio': self.bio,
             'profile_photo': self.profile_photo,
             'city': self.city,
-            'interests': self.interests.exists(),
+            'interests': self.has_interests,
         }
 
         filled = sum(1 for v in fields.values() if v)
@@ -66,7 +137,7 @@ class User(AbstractUser):
         base_percent = (filled / total) * 100
 
         # Bonus for interests & verification
-        if self.interests.exists():
+        if self.has_interests:
             base_percent += 10
         # if self.is_verified:
         #     base_percent += 10
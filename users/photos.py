@@ -0,0 +1,147 @@
+# users/photos.py
+"""
+Resized and pre-blurred copies of profile photos.
+
+Pages never send someone's original upload: matches who haven't revealed
+each other get a variant blurred on the server, everyone else a resized
+one. For every size in PHOTO_SIZES there is a WebP and a JPEG file, clear
+and blurred, stored under a random directory so variant URLs say nothing
+about the original's name. User.photo_variants records them:
+
+    {"source": "profile_photos/me.png",
+     "md": {"webp": "...", "jpeg": "..."}, "md_blur": {...}, ...}
+
+Uploads through the profile forms are processed on a thread pool after
+the transaction commits; ``manage.py backfill_photo_variants`` covers
+existing photos.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageFilter, ImageOps
+
+from .backends import invalidate_user
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels, about twice the largest box each size is shown in
+PHOTO_SIZES = {'sm': 96, 'md': 360}
+FORMATS = {'webp': ('WEBP', {'quality': 80}), 'jpeg': ('JPEG', {'quality': 85, 'optimize': True})}
+# Blurred variants are scaled up from this many pixels, so no detail survives
+BLUR_SOURCE_PX = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _encode(image, fmt):
+    name, options = FORMATS[fmt]
+    buf = BytesIO()
+    image.save(buf, name, **options)
+    return buf.getvalue()
+
+
+def render_variants(image):
+    """``{variant: {format: bytes}}`` for one opened image."""
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    tiny = ImageOps.fit(image, (BLUR_SOURCE_PX, BLUR_SOURCE_PX), Image.Resampling.BOX)
+
+    variants = {}
+    for size, px in PHOTO_SIZES.items():
+        clear = ImageOps.fit(image, (px, px), Image.Resampling.LANCZOS)
+        blurred = tiny.resize((px, px), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(px / 24))
+        variants[size] = {fmt: _encode(clear, fmt) for fmt in FORMATS}
+        variants[f'{size}_blur'] = {fmt: _encode(blurred, fmt) for fmt in FORMATS}
+    return variants
+
+
+def _variant_paths(variants):
+    return [path for key, files in variants.items() if key != 'source' for path in files.values()]
+
+
+def generate_photo_variants(user_id):
+    """
+    Render and store the variants of ``user_id``'s current photo.
+
+    Returns the new photo_variants, or None if the user has no photo or
+    changed it while this ran.
+    """
+    user = User.objects.only('id', 'profile_photo', 'photo_variants').filter(id=user_id).first()
+    if user is None or not user.profile_photo:
+        return None
+
+    source = user.profile_photo.name
+    with default_storage.open(source, 'rb') as f, Image.open(f) as image:
+        rendered = render_variants(image)
+
+    directory = f'profile_photos/variants/{uuid.uuid4().hex}'
+    variants = {'source': source}
+    for key, files in rendered.items():
+        variants[key] = {
+            fmt: default_storage.save(f'{directory}/{key}.{fmt}', ContentFile(data))
+            for fmt, data in files.items()
+        }
+
+    # Only if the photo is still the one rendered; a newer upload has its own job
+    updated = User.objects.filter(id=user_id, profile_photo=source).update(photo_variants=variants)
+    for path in _variant_paths((user.photo_variants if updated else variants) or {}):
+        default_storage.delete(path)
+    if not updated:
+        return None
+    invalidate_user(user_id)
+    return variants
+
+
+def _run(user_id):
+    try:
+        generate_photo_variants(user_id)
+    except Exception:
+        logger.exception("Could not generate photo variants for user %s", user_id)
+    finally:
+        # Worker threads open their own connections
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PHOTO_VARIANT_WORKERS, thread_name_prefix='photo-variants',
+            )
+        return _executor
+
+
+def schedule_photo_variants(user_id):
+    """Generate variants once the current transaction commits; inline if PHOTO_VARIANT_WORKERS is 0."""
+    def submit():
+        if settings.PHOTO_VARIANT_WORKERS:
+            _get_executor().submit(_run, user_id)
+        else:
+            generate_photo_variants(user_id)
+    transaction.on_commit(submit)
+
+
+def photo_variant(user, size, revealed):
+    """
+    ``{'webp': url, 'src': url}`` for ``user``'s photo at ``size``, blurred
+    unless ``revealed``; None if there is nothing safe to show.
+    """
+    if not user.profile_photo:
+        return None
+    variants = user.photo_variants or {}
+    if variants.get('source') == user.profile_photo.name:
+        files = variants[size if revealed else f'{size}_blur']
+        return {'webp': default_storage.url(files['webp']), 'src': default_storage.url(files['jpeg'])}
+    if revealed:
+        # Variants not generated yet; the original is fine once revealed
+        return {'webp': None, 'src': user.profile_photo.url}
+    return None
@@ -0,0 +1,88 @@
+# users/presence.py
+"""
+Who is online, without a database write per heartbeat.
+
+Heartbeats go to the cache, which answers online lookups, and into a
+per-process buffer. The buffer is written to User.last_seen in one bulk
+UPDATE once PRESENCE_FLUSH_INTERVAL seconds have passed, checked on each
+heartbeat and at the end of every request (users/signals.py), so last_seen
+in the database lags by about that much while the process serves traffic.
+Online lookups need a cache shared by all workers to see each other's
+heartbeats.
+"""
+from datetime import timedelta
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import User
+
+_pending = {}
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _cache_key(user_id):
+    return f'presence:{user_id}'
+
+
+def heartbeat(user_id, when=None):
+    """Record that ``user_id`` is active now; flushes the buffer when it is due."""
+    when = when or timezone.now()
+    cache.set(_cache_key(user_id), when, settings.PRESENCE_ONLINE_WINDOW)
+    with _lock:
+        _pending[user_id] = when
+    flush_if_due()
+
+
+def flush_if_due():
+    """Flush when the buffer has waited PRESENCE_FLUSH_INTERVAL; no queries otherwise."""
+    with _lock:
+        due = _pending and time.monotonic() - _last_flush >= settings.PRESENCE_FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def flush():
+    """Write buffered heartbeats to last_seen in one batch; returns how many users."""
+    global _last_flush
+    with _lock:
+        batch = _pending.copy()
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if batch:
+        User.objects.bulk_update(
+            [User(id=user_id, last_seen=when) for user_id, when in batch.items()],
+            ['last_seen'], batch_size=500,
+        )
+        # Cached request.user rows stay valid: get_cached_user re-reads last_seen on each hit
+    return len(batch)
+
+
+def last_seen(user_ids):
+    """``{user_id: last heartbeat}`` for the given users seen within the online window."""
+    keys = {_cache_key(user_id): user_id for user_id in user_ids}
+    return {keys[key]: when for key, when in cache.get_many(keys).items()}
+
+
+def _is_recent(when):
+    return when is not None and timezone.now() - when < timedelta(seconds=settings.PRESENCE_ONLINE_WINDOW)
+
+
+def online_ids(user_ids):
+    """
+    The subset of ``user_ids`` that are online; one cache round trip, no queries.
+
+    For pages that show presence for many users at once, where calling
+    is_online per user would mean a cache round trip each. No page lists
+    online status yet; User.is_online covers the single-user case.
+    """
+    return {user_id for user_id, when in last_seen(user_ids).items() if _is_recent(when)}
+
+
+def is_online(user):
+    # Fall back to the loaded row, e.g. after a cache restart
+    return _is_recent(cache.get(_cache_key(user.id)) or user.last_seen)
@@ -1,11 +1,77 @@
 # users/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, m2m_changed, pre_delete, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import user_logged_in
-from django.utils import timezone
+from django.core.signals import request_finished
+from django.db import transaction
+
+from . import presence
+from .backends import invalidate_user
+from .catalog import bump_catalog_version
+from .models import User, Interest
+from .utils import geo_cell, rebuild_interest_masks
 
 
 @receiver(user_logged_in)
 def update_last_seen(sender, user, request, **kwargs):
-    user.last_seen = timezone.now()
-    user.save(update_fields=['last_seen'])
\ No newline at end of file
+    presence.heartbeat(user.id)
+
+
+@receiver(request_finished)
+def flush_presence(sender, **kwargs):
+    # Heartbeats can stop arriving while others sit in the buffer
+    presence.flush_if_due()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(pre_save, sender=User)
+def update_geo_cell(sender, instance, **kwargs):
+    instance.geo_cell = geo_cell(instance.latitude, instance.longitude)
+
+
+@receiver(pre_save, sender=User)
+def update_profile_completion(sender, instance, update_fields=None, **kwargs):
+    # Partial saves that don't touch a source field would only load deferred columns for nothing
+    if update_fields is None or 'profile_completion' in update_fields:
+        instance.profile_completion = instance.compute_profile_completion()
+
+
+@receiver(m2m_changed, sender=User.interests.through)
+def update_interest_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        # pk_set is empty on clear, so remember who is affected before the rows go
+        instance._interest_mask_user_ids = list(instance.user_set.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        rebuild_interest_masks([instance.pk])
+        instance.refresh_from_db(fields=['interest_mask', 'profile_completion', 'profile_version'])
+    elif action == 'post_clear':
+        rebuild_interest_masks(instance.__dict__.pop('_interest_mask_user_ids', []))
+    else:
+        rebuild_interest_masks(pk_set)
+
+
+@receiver(post_save, sender=Interest)
+@receiver(post_delete, sender=Interest)
+def bump_interest_catalog(sender, **kwargs):
+    bump_catalog_version()
+    # Again once committed, in case another process reloaded the old rows meanwhile
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(pre_delete, sender=Interest)
+def remember_interest_users(sender, instance, **kwargs):
+    instance._interest_mask_user_ids = list(instance.user_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Interest)
+def clear_deleted_interest(sender, instance, **kwargs):
+    rebuild_interest_masks(instance.__dict__.pop('_interest_mask_user_ids', []))
@@ -0,0 +1,14 @@
+from django import template
+
+from users.photos import photo_variant as _photo_variant
+
+register = template.Library()
+
+
+@register.simple_tag
+def photo_variant(user, size, revealed=False):
+    """
+    {% photo_variant person 'sm' match.is_friend as photo %}: the clear or
+    server-blurred copy of ``person``'s photo, for users/_photo.html.
+    """
+    return _photo_variant(user, size, bool(revealed))
@@ -1,3 +1,354 @@
-from django.test import TestCase
+from contextlib import redirect_stdout
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+import json
+import math
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.core.cache import cache, caches
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from benchmarks.budget import Endpoint, EndpointBudgetTestCase
+from match.utils import DISCOVERY_RADIUS_KM
+from . import presence
+from .catalog import get_catalog
+from .models import Interest, User
+from .photos import photo_variant
+from .utils import (
+    EARTH_RADIUS_KM, EMPTY_INTEREST_MASK, GEO_CELL_COLS, INTEREST_MASK_BITS, cells_covering, geo_cell,
+    interest_ids_from_mask, nearby_user_ids,
+)
+
+
+class UserEndpointBudgetTests(EndpointBudgetTestCase):
+    urlconf = 'users.urls'
+    endpoints = {
+        'register': Endpoint(anonymous=True),
+        'login': Endpoint(anonymous=True),
+        'profile': Endpoint(),
+        'edit': Endpoint(),
+        'logout': Endpoint(),
+        'update_last_seen': Endpoint(method='post'),
+    }
+
+
+def destination(lat, lon, km, bearing):
+    """The point ``km`` from (lat, lon) along ``bearing`` degrees on the sphere."""
+    angle, bearing, lat = km / EARTH_RADIUS_KM, math.radians(bearing), math.radians(lat)
+    lat2 = math.asin(math.sin(lat) * math.cos(angle) + math.cos(lat) * math.sin(angle) * math.cos(bearing))
+    lon2 = math.radians(lon) + math.atan2(
+        math.sin(bearing) * math.sin(angle) * math.cos(lat), math.cos(angle) - math.sin(lat) * math.sin(lat2),
+    )
+    return math.degrees(lat2), (math.degrees(lon2) + 540) % 360 - 180
+
+
+class GeoCellTests(TestCase):
+    def test_cell_boundaries(self):
+        self.assertIsNone(geo_cell(None, 10.0))
+        self.assertEqual(geo_cell(-90, -180), 0)
+        self.assertEqual(geo_cell(0, 0), 180 * GEO_CELL_COLS + 360)
+        # Lower edges belong to the cell; the north pole joins the top row, 180 wraps to -180
+        self.assertEqual(geo_cell(0.5, 0.5) - geo_cell(0.49, 0.49), GEO_CELL_COLS + 1)
+        self.assertEqual(geo_cell(90, 0), geo_cell(89.9, 0))
+        self.assertEqual(geo_cell(10, 180), geo_cell(10, -180))
+
+    def test_radius_is_covered_near_edges_antimeridian_and_poles(self):
+        origins = [(59.5, 10.5), (45.25, 10.25), (0.1, 179.95), (-30.0, -179.99), (89.5, 0.0), (-89.95, 45.0)]
+        for lat, lon in origins:
+            covered = set(cells_covering(lat, lon, DISCOVERY_RADIUS_KM))
+            for km in (1, 50, DISCOVERY_RADIUS_KM - 0.01):
+                for bearing in range(0, 360, 15):
+                    point = destination(lat, lon, km, bearing)
+                    self.assertIn(geo_cell(*point), covered, ((lat, lon), km, bearing))
+
+    def test_backfill_fills_rows_saved_before_the_column(self):
+        located = User.objects.create_user('located', password='x', latitude=59.91, longitude=10.75)
+        unplaced = User.objects.create_user('unplaced', password='x')
+        User.objects.update(geo_cell=None)
+        call_command('backfill_geo_cells', batch_size=1, stdout=StringIO())
+        located.refresh_from_db()
+        unplaced.refresh_from_db()
+        self.assertEqual(located.geo_cell, geo_cell(59.91, 10.75))
+        self.assertIsNone(unplaced.geo_cell)
+        self.assertIn(located.id, nearby_user_ids(59.95, 10.8, DISCOVERY_RADIUS_KM))
+
+
+class PresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        presence.flush()
+        self.users = [User.objects.create_user(f'presence{i}', password='x') for i in range(3)]
+
+    def test_heartbeats_are_buffered_then_flushed_in_one_query(self):
+        with self.assertNumQueries(0):
+            for user in self.users[:2]:
+                presence.heartbeat(user.id)
+        self.assertEqual(presence.online_ids([u.id for u in self.users]), {self.users[0].id, self.users[1].id})
+        self.assertIsNone(User.objects.get(id=self.users[0].id).last_seen)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(presence.flush(), 2)
+        self.assertIsNotNone(User.objects.get(id=self.users[0].id).last_seen)
+
+    @override_settings(PRESENCE_FLUSH_INTERVAL=0)
+    def test_heartbeat_flushes_when_due(self):
+        self.client.force_login(self.users[0])
+        self.client.post(reverse('users:update_last_seen'))
+        user = User.objects.get(id=self.users[0].id)
+        self.assertIsNotNone(user.last_seen)
+        self.assertTrue(user.is_online)
+
+    def test_buffer_is_flushed_at_end_of_request_when_due(self):
+        presence.heartbeat(self.users[0].id)
+        with override_settings(PRESENCE_FLUSH_INTERVAL=0):
+            self.client.get(reverse('users:login'))
+        self.assertIsNotNone(User.objects.get(id=self.users[0].id).last_seen)
+
+    def test_stale_heartbeat_is_offline(self):
+        presence.heartbeat(self.users[0].id, timezone.now() - timedelta(minutes=5))
+        self.assertEqual(presence.online_ids([self.users[0].id]), set())
+        self.assertFalse(self.users[0].is_online)
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cached', password='x')
+        self.client.force_login(self.user)
+        self.url = reverse('users:profile')
+
+    def test_saved_changes_reach_the_next_request(self):
+        self.assertEqual(self.client.get(self.url).wsgi_request.user.city, '')
+        # Served from the cache: writes that skip save() aren't seen
+        User.objects.filter(id=self.user.id).update(city="Oslo")
+        self.assertEqual(self.client.get(self.url).wsgi_request.user.city, '')
+
+        self.user.city = "Bergen"
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).wsgi_request.user.city, "Bergen")
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertFalse(self.client.get(self.url).wsgi_request.user.is_authenticated)
+
+    def test_auth_changes_from_other_processes_are_seen(self):
+        self.client.get(self.url)
+        # update() skips the signals, like a save in another worker
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertFalse(self.client.get(self.url).wsgi_request.user.is_authenticated)
+
+        User.objects.filter(id=self.user.id).update(is_active=True)
+        self.client.force_login(self.user)
+        self.client.get(self.url)
+        self.user.set_password('changed')
+        User.objects.filter(id=self.user.id).update(password=self.user.password)
+        self.assertFalse(self.client.get(self.url).wsgi_request.user.is_authenticated)
+
+    def test_presence_flush_keeps_entry(self):
+        self.client.get(self.url)
+        presence.heartbeat(self.user.id)
+        presence.flush()
+        self.assertIsNotNone(caches['users'].get(f'user:{self.user.id}'))
+        user = self.client.get(self.url).wsgi_request.user
+        self.assertIsNotNone(user.last_seen)
+
+
+class ProfileCompletionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('complete', password='x')
+        self.interest = Interest.objects.create(name='Chess')
+
+    def stored(self):
+        return User.objects.values_list('profile_completion', flat=True).get(id=self.user.id)
+
+    def test_column_follows_profile_fields_and_interests(self):
+        self.assertEqual(self.stored(), 0)
+
+        self.user.city = "Lisbon"
+        self.user.save(update_fields=['city'])
+        self.assertEqual(self.stored(), 17)
+
+        self.user.interests.add(self.interest)
+        self.assertEqual((self.user.profile_completion, self.stored()), (43, 43))
+
+        self.user.interests.clear()
+        self.assertEqual(self.stored(), 17)
+
+    def test_backfill_fixes_stale_rows(self):
+        self.user.city = "Lisbon"
+        self.user.save()
+        User.objects.filter(id=self.user.id).update(profile_completion=0)
+
+        call_command('backfill_profile_completion', stdout=StringIO())
+        self.assertEqual(self.stored(), self.user.compute_profile_completion())
+
+
+class InterestCatalogTests(TestCase):
+    def setUp(self):
+        self.chess = Interest.objects.create(name='Chess')
+        self.yoga = Interest.objects.create(name='Yoga')
+
+    def test_catalog_reloads_only_after_interest_changes(self):
+        self.assertEqual(get_catalog().choices, [(self.chess.id, 'Chess'), (self.yoga.id, 'Yoga')])
+        with self.assertNumQueries(0):
+            catalog = get_catalog()
+        self.assertEqual(json.loads(catalog.json), [[self.chess.id, 'Chess'], [self.yoga.id, 'Yoga']])
+
+        self.yoga.delete()
+        self.assertEqual(get_catalog().choices, [(self.chess.id, 'Chess')])
+
+    def test_profile_form_validates_against_catalog(self):
+        user = User.objects.create_user('catalog', password='x')
+        self.client.force_login(user)
+        data = {'gender': 'F', 'bio': "Hi", 'city': "Oslo", 'dob': '1990-01-01'}
+        url = reverse('users:edit')
+
+        self.client.post(url, {**data, 'interests': [self.yoga.id]})
+        self.assertEqual(list(user.interests.values_list('id', flat=True)), [self.yoga.id])
+
+        response = self.client.post(url, {**data, 'interests': [self.yoga.id + 100]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(user.interests.values_list('id', flat=True)), [self.yoga.id])
+
+    def test_changes_from_other_processes_are_picked_up(self):
+        get_catalog()
+        # Another process's bump only reaches its own cache
+        with mock.patch('users.signals.bump_catalog_version'):
+            tennis = Interest.objects.create(name='Tennis')
+        self.assertNotIn(tennis.id, get_catalog().names)
+
+        with override_settings(INTEREST_CATALOG_TTL=0):
+            self.assertIn(tennis.id, get_catalog().names)
+
+    def test_profile_form_reloads_for_unknown_ids(self):
+        get_catalog()
+        with mock.patch('users.signals.bump_catalog_version'):
+            tennis = Interest.objects.create(name='Tennis')
+        user = User.objects.create_user('catalog', password='x')
+        self.client.force_login(user)
+        data = {'gender': 'F', 'bio': "Hi", 'city': "Oslo", 'dob': '1990-01-01', 'interests': [tennis.id]}
+        self.client.post(reverse('users:edit'), data)
+        self.assertEqual(list(user.interests.values_list('id', flat=True)), [tennis.id])
+
+
+class InterestLimitTests(TestCase):
+    def test_ids_past_the_mask_are_refused(self):
+        Interest.objects.create(id=INTEREST_MASK_BITS, name='Last')
+        with self.assertRaises(ValidationError):
+            Interest(name='Overflow').full_clean()
+        with self.assertRaises(ValidationError):
+            Interest.objects.create(name='Overflow')
+        self.assertFalse(Interest.objects.filter(name='Overflow').exists())
+
+    def test_migration_skips_ids_past_the_mask(self):
+        fill = import_module('users.migrations.0006_user_interest_mask').fill_interest_masks
+        user = User.objects.create_user('legacy', password='x')
+        # Rows from before the check, written around Interest.save()
+        Interest.objects.bulk_create([Interest(id=3, name='Fits'), Interest(id=INTEREST_MASK_BITS + 1, name='Past')])
+        User.interests.through.objects.bulk_create(
+            User.interests.through(user=user, interest_id=i) for i in (3, INTEREST_MASK_BITS + 1)
+        )
+        with redirect_stdout(StringIO()) as out:
+            fill(apps, None)
+        self.assertIn(f"Interest id {INTEREST_MASK_BITS + 1} does not fit", out.getvalue())
+        user.refresh_from_db()
+        self.assertEqual(interest_ids_from_mask(user.interest_mask), [3])
+
+
+class InterestMaskSignalTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(f'mask{i}', password='x') for i in range(2)]
+        self.chess, self.yoga, self.golf = (Interest.objects.create(name=n) for n in ("Chess", "Yoga", "Golf"))
+
+    def assertMasksMatch(self):
+        for user in User.objects.filter(id__in=[u.id for u in self.users]):
+            ids = sorted(user.interests.values_list('id', flat=True))
+            self.assertEqual(interest_ids_from_mask(user.interest_mask), ids, user.username)
+
+    def test_forward_add_remove_clear(self):
+        user = self.users[0]
+        user.interests.add(self.chess, self.yoga)
+        self.assertEqual(interest_ids_from_mask(user.interest_mask), sorted([self.chess.id, self.yoga.id]))
+        self.assertMasksMatch()
+        user.interests.remove(self.chess)
+        self.assertMasksMatch()
+        user.interests.set([self.golf])
+        self.assertMasksMatch()
+        user.interests.clear()
+        self.assertEqual(bytes(user.interest_mask), EMPTY_INTEREST_MASK)
+        self.assertMasksMatch()
+
+    def test_profile_edit_bumps_profile_version_once(self):
+        user = self.users[0]
+        user.interests.add(self.chess)
+        self.client.force_login(user)
+        data = {'gender': 'F', 'bio': "Hi", 'city': "Oslo", 'dob': '1990-01-01'}
+
+        for interests in ([self.yoga.id, self.golf.id], [self.yoga.id, self.golf.id], [self.golf.id], []):
+            before = User.objects.get(id=user.id).profile_version
+            self.client.post(reverse('users:edit'), {**data, 'interests': interests})
+            self.assertEqual(User.objects.get(id=user.id).profile_version, before + 1, interests)
+            self.assertMasksMatch()
+
+    def test_reverse_add_remove_clear(self):
+        self.golf.user_set.add(*self.users)
+        self.assertMasksMatch()
+        self.golf.user_set.remove(self.users[0])
+        self.assertMasksMatch()
+        self.users[0].interests.add(self.chess)
+        self.chess.user_set.add(self.users[1])
+        self.chess.user_set.clear()
+        self.assertMasksMatch()
+        self.assertEqual(interest_ids_from_mask(User.objects.get(id=self.users[1].id).interest_mask), [self.golf.id])
+
+
+def png(color='red', size=(400, 300)):
+    buf = BytesIO()
+    Image.new('RGB', size, color).save(buf, 'PNG')
+    return SimpleUploadedFile('me.png', buf.getvalue(), content_type='image/png')
+
+
+class PhotoVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, PHOTO_VARIANT_WORKERS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('photo', password='x')
+
+    def test_upload_renders_clear_and_blurred_variants(self):
+        self.client.force_login(self.user)
+        data = {'gender': 'F', 'bio': "Hi", 'city': "Oslo", 'dob': '1990-01-01', 'profile_photo': png()}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('users:edit'), data)
+
+        self.user.refresh_from_db()
+        variants = self.user.photo_variants
+        self.assertEqual(variants['source'], self.user.profile_photo.name)
+        self.assertEqual(set(variants) - {'source'}, {'sm', 'sm_blur', 'md', 'md_blur'})
+        with default_storage.open(variants['md_blur']['jpeg']) as f, Image.open(f) as image:
+            self.assertEqual(image.size, (360, 360))
+
+        clear, blurred = photo_variant(self.user, 'sm', True), photo_variant(self.user, 'sm', False)
+        self.assertEqual(clear['src'], default_storage.url(variants['sm']['jpeg']))
+        self.assertEqual(blurred['webp'], default_storage.url(variants['sm_blur']['webp']))
+        self.assertNotIn(self.user.profile_photo.url, (blurred['src'], blurred['webp']))
+
+    def test_original_is_only_a_fallback_once_revealed(self):
+        self.user.profile_photo.save('me.png', png(), save=True)
+        self.assertIsNone(photo_variant(self.user, 'md', False))
+        self.assertEqual(photo_variant(self.user, 'md', True)['src'], self.user.profile_photo.url)
+
+        call_command('backfill_photo_variants', workers=0, stdout=StringIO())
+        self.user.refresh_from_db()
+        self.assertIn('md_blur', self.user.photo_variants)
@@ -0,0 +1,124 @@
+# users/utils.py
+import math
+
+import numpy as np
+
+# Geo cells: a fixed lat/lon grid, numbered row by row from the south-west corner
+GEO_CELL_DEG = 0.5
+GEO_CELL_ROWS = int(180 / GEO_CELL_DEG)
+GEO_CELL_COLS = int(360 / GEO_CELL_DEG)
+EARTH_RADIUS_KM = 6371.0
+
+
+def _cell_row(lat):
+    return min(int((lat + 90) // GEO_CELL_DEG), GEO_CELL_ROWS - 1)
+
+
+def _cell_col(lon):
+    return int((lon + 180) // GEO_CELL_DEG) % GEO_CELL_COLS
+
+
+def geo_cell(lat, lon):
+    """Grid cell number for a point, or None if the location is not set."""
+    if lat is None or lon is None:
+        return None
+    return _cell_row(lat) * GEO_CELL_COLS + _cell_col(lon)
+
+
+def cells_covering(lat, lon, radius_km):
+    """All cell numbers that may hold a point within ``radius_km`` of (lat, lon)."""
+    angle = radius_km / EARTH_RADIUS_KM
+    dlat = math.degrees(angle)
+    lat_lo, lat_hi = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    rows = range(_cell_row(lat_lo), _cell_row(lat_hi) + 1)
+
+    # Widest longitude span is at the band edge closest to a pole
+    edge_cos = math.cos(math.radians(max(abs(lat_lo), abs(lat_hi))))
+    if lat_lo <= -90 or lat_hi >= 90 or math.sin(angle) >= edge_cos:
+        cols = range(GEO_CELL_COLS)
+    else:
+        dlon = math.degrees(math.asin(math.sin(angle) / edge_cos))
+        first, last = int((lon - dlon + 180) // GEO_CELL_DEG), int((lon + dlon + 180) // GEO_CELL_DEG)
+        if last - first + 1 >= GEO_CELL_COLS:
+            cols = range(GEO_CELL_COLS)
+        else:
+            cols = sorted({c % GEO_CELL_COLS for c in range(first, last + 1)})
+
+    return [row * GEO_CELL_COLS + col for row in rows for col in cols]
+
+
+def nearby_user_ids(lat, lon, radius_km):
+    """Ids of users in the cells covering the radius, as a lazy queryset for SQL filtering."""
+    from .models import User
+    return User.objects.filter(
+        geo_cell__in=cells_covering(lat, lon, radius_km)
+    ).values_list('id', flat=True)
+
+
+# Interest masks: bit (id - 1) is set when the user has the Interest with that id
+INTEREST_MASK_BYTES = 32
+INTEREST_MASK_BITS = INTEREST_MASK_BYTES * 8
+EMPTY_INTEREST_MASK = bytes(INTEREST_MASK_BYTES)
+
+
+def interest_mask(interest_ids):
+    """Pack interest ids into a fixed-width little-endian bitmask."""
+    bits = 0
+    for interest_id in interest_ids:
+        if not 1 <= interest_id <= INTEREST_MASK_BITS:
+            raise ValueError(f"Interest id {interest_id} does not fit in a {INTEREST_MASK_BITS}-bit mask")
+        bits |= 1 << (interest_id - 1)
+    return bits.to_bytes(INTEREST_MASK_BYTES, 'little')
+
+
+def interest_ids_from_mask(mask):
+    bits = int.from_bytes(bytes(mask), 'little')
+    return [i + 1 for i in range(INTEREST_MASK_BITS) if bits >> i & 1]
+
+
+def interest_count(mask):
+    return int.from_bytes(bytes(mask), 'little').bit_count()
+
+
+def shared_interest_count(mask_a, mask_b):
+    return (int.from_bytes(bytes(mask_a), 'little') & int.from_bytes(bytes(mask_b), 'little')).bit_count()
+
+
+def pack_interest_masks(masks):
+    """Stack masks into an (n, INTEREST_MASK_BYTES) uint8 array for bulk scoring."""
+    if not masks:
+        return np.zeros((0, INTEREST_MASK_BYTES), dtype=np.uint8)
+    return np.frombuffer(b''.join(bytes(m) for m in masks), dtype=np.uint8).reshape(-1, INTEREST_MASK_BYTES)
+
+
+def shared_interest_counts(mask, packed):
+    """Shared-interest count between ``mask`` and every row of a packed mask array."""
+    mine = np.frombuffer(bytes(mask), dtype=np.uint8)
+    return np.bitwise_count(packed & mine).sum(axis=1, dtype=np.int64)
+
+
+def rebuild_interest_masks(user_ids):
+    """
+    Recompute interest_mask from the M2M table for the given users, refresh
+    the profile_completion that depends on it and bump their profile_version.
+    """
+    from django.db.models import F
+    from .backends import invalidate_user
+    from .models import User
+    user_ids = list(user_ids)
+    users = User.objects.filter(id__in=user_ids).only('id', 'dob', 'gender', 'bio', 'profile_photo', 'city')
+    users = {user.id: user for user in users}
+    interests = {user_id: [] for user_id in users}
+    for user_id, interest_id in User.interests.through.objects.filter(
+        user_id__in=user_ids
+    ).values_list('user_id', 'interest_id'):
+        interests[user_id].append(interest_id)
+
+    for user_id, ids in interests.items():
+        user = users[user_id]
+        user.interest_mask = interest_mask(ids)
+        user.profile_completion = user.compute_profile_completion()
+    User.objects.bulk_update(users.values(), ['interest_mask', 'profile_completion'])
+    User.objects.filter(id__in=user_ids).update(profile_version=F('profile_version') + 1)
+    invalidate_user(*user_ids)
+    return {user.id: user.interest_mask for user in users.values()}
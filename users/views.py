@@ -2,11 +2,14 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib import messages
 from .forms import UserRegisterForm, UserProfileForm,UserLoginForm
-from .models import User,Interest
+from .catalog import get_catalog
+from .models import User
+from .utils import interest_ids_from_mask
 from django.contrib.auth.decorators import login_required
 import json
 from django.http import JsonResponse
-from django.utils import timezone
+from . import presence
+from match.feed import rescore_candidate, invalidate_feed
 
 def register_view(request):
     if request.method == 'POST':
@@ -22,7 +25,7 @@ def register_view(request):
 
 @login_required
 def profile_view(request):
-    completion = request.user.profile_completion()
+    completion = request.user.profile_completion
     can_access_match = completion >= 80
     return render(request, 'users/profile.html', {
         'completion': completion,
@@ -35,19 +38,22 @@ def edit_profile(request):
         form = UserProfileForm(request.POST, request.FILES, instance=request.user)
         if form.is_valid():
             user = form.save()
-            interest_ids = request.POST.getlist('interests')
-            user.interests.set(interest_ids)
+            # An interest change bumps profile_version in the m2m_changed receiver; other edits bump here
+            if not user.set_interests(form.cleaned_data['interests']):
+                user.bump_profile_version()
+            # Keep materialized discovery feeds in step with the new profile
+            rescore_candidate(user)
+            invalidate_feed(user)
             messages.success(request, "Profile updated!")
             return redirect('users:profile')
     else:
         form = UserProfileForm(instance=request.user)
 
-    interests_data = list(Interest.objects.values_list('id', 'name'))
-    selected_ids = list(request.user.interests.values_list('id', flat=True))
+    selected_ids = interest_ids_from_mask(request.user.interest_mask)
 
     return render(request, 'users/edit_profile.html', {
         'form': form,
-        'interests_data': json.dumps(interests_data),
+        'interests_data': get_catalog().json,
         'selected_ids': json.dumps(selected_ids),
     })
 
@@ -83,6 +89,5 @@ def logout_view(request):
 
 @login_required
 def update_last_seen(request):
-    request.user.last_seen = timezone.now()
-    request.user.save(update_fields=['last_seen'])
+    presence.heartbeat(request.user.id)
     return JsonResponse({'status': 'updated'})
\ No newline at end of file